@@ -12,142 +12,141 @@ To run:
 2. Run: streamlit run dashboard.py
 """
 
+import os
+import sys
 import streamlit as st
-import pandas as pd
 import matplotlib
 matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
-import seaborn as sns
 
+import dashboard_charts as charts
 
-# Load data
-data = pd.read_csv("Data/data.csv")
+# The rendering engine and aggregation helpers are shared with the Flask app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_app'))
+from rendering import RenderPool, DEFAULT_PRELOAD
+from result_cache import file_sha256
+import dashboard_data
 
-# Calculate total spending per category (fix column names)
-spend_cols = ['spend_wine', 'spend_fruits', 'spend_meat', 'spend_fish', 'spend_sweets', 'spend_gold']
-data['TotalSpend'] = data[spend_cols].sum(axis=1)
 
-# Sidebar
-st.sidebar.title("Retail Buyer Segmentation Dashboard")
-st.sidebar.markdown("Analyze customer spending and behavior.")
+@st.cache_resource
+def get_render_pool():
+	"""Warm process pool with the plotting stack pre-imported, shared across reruns"""
+	pool = RenderPool(max_workers=min(8, os.cpu_count() or 1), preload=DEFAULT_PRELOAD + ('seaborn', 'dashboard_charts'))
+	pool.warm()
+	return pool
 
-st.title("Retail Buyer Segmentation Dashboard")
 
+@st.cache_data(show_spinner=False)
+def get_file_digest(path, mtime_ns, size):
+	"""Content hash of the data file, recomputed only when its mtime or size changes"""
+	return file_sha256(path)
 
-# 1. Total spending by product category
-st.header("1. Total Spending by Product Category")
-category_totals = data[spend_cols].sum().sort_values(ascending=False)
-fig1, ax1 = plt.subplots()
-sns.barplot(x=category_totals.values, y=category_totals.index.str.replace('spend_', '').str.title(), ax=ax1, palette="viridis")
-ax1.set_xlabel("Total Spend")
-ax1.set_ylabel("Product Category")
-st.pyplot(fig1)
 
-st.markdown("""
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_summary(path, digest):
+	"""Precomputed dashboard aggregates for one version of the data file"""
+	return dashboard_data.load_summary(path)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_chart_images(digest, _summary):
+	"""Render all eight figures in parallel; the page waits only for the slowest one"""
+	if _summary['large']:
+		income_chart = charts.income_vs_spend_density_chart
+		web_visits_chart = charts.web_visits_box_stats_chart
+	else:
+		income_chart = charts.income_vs_spend_chart
+		web_visits_chart = charts.web_visits_chart
+
+	return get_render_pool().render_many([
+		(charts.category_totals_chart, _summary['category_totals']),
+		(income_chart, _summary['income_spend']),
+		(charts.channel_chart, _summary['channel_df']),
+		(charts.education_spend_chart, _summary['edu_spend']),
+		(charts.age_spend_chart, _summary['age_spend']),
+		(charts.marital_spend_chart, _summary['marital_spend']),
+		(charts.campaign_chart, _summary['campaign_acceptance']),
+		(web_visits_chart, _summary['web_visits_spend']),
+	], bbox_inches='tight')
+
+
+def main():
+	"""Build the dashboard page"""
+	# Load data; every step below is cached, so reruns only redraw
+	path = dashboard_data.DATA_PATH
+	digest = get_file_digest(path, *dashboard_data.file_signature(path))
+	summary = get_summary(path, digest)
+	correlation = summary['correlation']
+	(fig1, fig2, fig3, fig4, fig5, fig6, fig7, fig8) = get_chart_images(digest, summary)
+
+	# Sidebar
+	st.sidebar.title("Retail Buyer Segmentation Dashboard")
+	st.sidebar.markdown("Analyze customer spending and behavior.")
+
+	st.title("Retail Buyer Segmentation Dashboard")
+
+
+	# 1. Total spending by product category
+	st.header("1. Total Spending by Product Category")
+	st.image(fig1)
+
+	st.markdown("""
 - **Wine** and **Meat** are the main drivers of customer spending.
 - Wine spending is the highest, followed by Meat. Other categories contribute less.
 - There is a large variation in total spending among customers.
 """)
 
-# 2. Relationship between annual income and total spending
-st.header("2. Annual Income vs. Total Spending")
-fig2, ax2 = plt.subplots()
-sns.scatterplot(x=data['annual_income'], y=data['TotalSpend'], ax=ax2, alpha=0.6)
-ax2.set_xlabel("Annual Income")
-ax2.set_ylabel("Total Spending")
-st.pyplot(fig2)
-
-correlation = data['annual_income'].corr(data['TotalSpend'])
-st.markdown(f"**Correlation between annual income and total spending:** {correlation:.2f}")
-st.markdown("""
+	# 2. Relationship between annual income and total spending
+	st.header("2. Annual Income vs. Total Spending")
+	st.image(fig2)
+
+	st.markdown(f"**Correlation between annual income and total spending:** {correlation:.2f}")
+	st.markdown("""
 - There is a strong positive relationship between annual income and total spending.
 - Most high spenders (Total Spend > 1500) have incomes between 50,000 and 100,000.
 """)
 
 
-# 3. Purchase channel preferences
-st.header("3. Purchase Channel Preferences")
-channels = {
-	'num_store_purchases': 'Store',
-	'num_web_purchases': 'Web',
-	'num_catalog_purchases': 'Catalog',
-	'num_discount_purchases': 'Deals'
-}
-channel_totals = {v: data[k].sum() for k, v in channels.items() if k in data.columns}
-channel_df = pd.DataFrame(list(channel_totals.items()), columns=['Channel', 'Total Purchases'])
-fig3, ax3 = plt.subplots()
-sns.barplot(x='Total Purchases', y='Channel', data=channel_df, ax=ax3, palette="mako")
-ax3.set_xlabel("Total Purchases")
-ax3.set_ylabel("Channel")
-st.pyplot(fig3)
-
-st.markdown("""
+	# 3. Purchase channel preferences
+	st.header("3. Purchase Channel Preferences")
+	st.image(fig3)
+
+	st.markdown("""
 - **Store** is the preferred purchase channel, followed by **Web**.
 - Catalog and Deals channels are used less frequently.
 """)
 
 
-# 4. More Insights & Graphs
-st.header("4. More Insights & Graphs")
-
-# Spending by Education Level
-st.subheader("Spending by Education Level")
-edu_spend = data.groupby('education_level')['TotalSpend'].mean().sort_values(ascending=False)
-fig4, ax4 = plt.subplots()
-edu_spend.plot(kind='bar', ax=ax4, color='skyblue')
-ax4.set_ylabel('Average Total Spend')
-ax4.set_xlabel('Education Level')
-st.pyplot(fig4)
-st.markdown("- Customers with higher education levels tend to spend more on average.")
-
-# Spending by Age Group
-st.subheader("Spending by Age Group")
-import numpy as np
-data['age'] = 2025 - data['birth_year']
-bins = [18, 30, 40, 50, 60, 70, 100]
-labels = ['18-29', '30-39', '40-49', '50-59', '60-69', '70+']
-data['age_group'] = pd.cut(data['age'], bins=bins, labels=labels, right=False)
-age_spend = data.groupby('age_group')['TotalSpend'].mean()
-fig5, ax5 = plt.subplots()
-age_spend.plot(kind='bar', ax=ax5, color='coral')
-ax5.set_ylabel('Average Total Spend')
-ax5.set_xlabel('Age Group')
-st.pyplot(fig5)
-st.markdown("- Spending varies by age group, with certain age ranges spending more on average.")
-
-# Spending by Marital Status
-st.subheader("Spending by Marital Status")
-marital_spend = data.groupby('marital_status')['TotalSpend'].mean().sort_values(ascending=False)
-fig6, ax6 = plt.subplots()
-marital_spend.plot(kind='bar', ax=ax6, color='mediumseagreen')
-ax6.set_ylabel('Average Total Spend')
-ax6.set_xlabel('Marital Status')
-st.pyplot(fig6)
-st.markdown("- Marital status influences spending patterns.")
-
-# Campaign Acceptance Rate
-st.subheader("Campaign Acceptance Rate")
-campaign_cols = [col for col in data.columns if col.startswith('accepted_campaign_')]
-campaign_acceptance = data[campaign_cols].sum()
-fig7, ax7 = plt.subplots()
-campaign_acceptance.plot(kind='bar', ax=ax7, color='slateblue')
-ax7.set_ylabel('Number of Acceptances')
-ax7.set_xlabel('Campaign')
-st.pyplot(fig7)
-st.markdown("- Shows which campaigns were most successful.")
-
-# Web Visits vs. Total Spend
-st.subheader("Web Visits vs. Total Spend")
-fig8, ax8 = plt.subplots()
-sns.boxplot(x=data['web_visits_last_month'], y=data['TotalSpend'], ax=ax8)
-ax8.set_xlabel('Web Visits Last Month')
-ax8.set_ylabel('Total Spend')
-st.pyplot(fig8)
-st.markdown("- Analyzes if frequent web visits are associated with higher spending.")
-
-# 5. Key Findings
-st.header("Key Findings Summary")
-st.markdown("""
+	# 4. More Insights & Graphs
+	st.header("4. More Insights & Graphs")
+
+	# Spending by Education Level
+	st.subheader("Spending by Education Level")
+	st.image(fig4)
+	st.markdown("- Customers with higher education levels tend to spend more on average.")
+
+	# Spending by Age Group
+	st.subheader("Spending by Age Group")
+	st.image(fig5)
+	st.markdown("- Spending varies by age group, with certain age ranges spending more on average.")
+
+	# Spending by Marital Status
+	st.subheader("Spending by Marital Status")
+	st.image(fig6)
+	st.markdown("- Marital status influences spending patterns.")
+
+	# Campaign Acceptance Rate
+	st.subheader("Campaign Acceptance Rate")
+	st.image(fig7)
+	st.markdown("- Shows which campaigns were most successful.")
+
+	# Web Visits vs. Total Spend
+	st.subheader("Web Visits vs. Total Spend")
+	st.image(fig8)
+	st.markdown("- Analyzes if frequent web visits are associated with higher spending.")
+
+	# 5. Key Findings
+	st.header("Key Findings Summary")
+	st.markdown("""
 1. **Wine dominates spending**: Wine and Meat are the top categories, with significant variation in total spending among customers.
 2. **Income drives spending**: There is a strong positive correlation between annual income and total spending.
 3. **Store is preferred**: Most purchases are made in-store, but web purchases are also significant.
@@ -155,3 +154,8 @@ st.markdown("""
 5. **Campaign effectiveness** varies, with some campaigns being more successful than others.
 6. **Web activity** may be linked to spending, but the relationship is nuanced.
 """)
+
+
+if __name__ == "__main__":
+	# Render workers re-import this script; only Streamlit's run builds the page
+	main()
@@ -0,0 +1,102 @@
+"""
+Chart renderers for the Retail Buyer Segmentation dashboard.
+
+Each function takes the (already aggregated) data for one chart and returns a
+standalone matplotlib Figure, so the dashboard can render them in parallel on
+a process pool.
+"""
+
+import numpy as np
+import seaborn as sns
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+
+
+def category_totals_chart(category_totals):
+	"""Horizontal bar chart of total spend per product category"""
+	fig = Figure()
+	ax = fig.subplots()
+	sns.barplot(x=category_totals.values, y=category_totals.index.str.replace('spend_', '').str.title(), ax=ax, palette="viridis")
+	ax.set_xlabel("Total Spend")
+	ax.set_ylabel("Product Category")
+	return fig
+
+
+def income_vs_spend_chart(data):
+	"""Scatter of annual income against total spending"""
+	fig = Figure()
+	ax = fig.subplots()
+	sns.scatterplot(x=data['annual_income'], y=data['TotalSpend'], ax=ax, alpha=0.6)
+	ax.set_xlabel("Annual Income")
+	ax.set_ylabel("Total Spending")
+	return fig
+
+
+def income_vs_spend_density_chart(binned):
+	"""Density of annual income against total spending from a 2-D histogram"""
+	fig = Figure()
+	ax = fig.subplots()
+	mesh = ax.pcolormesh(binned['xedges'], binned['yedges'], np.ma.masked_equal(binned['counts'].T, 0), cmap='viridis', norm=LogNorm())
+	fig.colorbar(mesh, ax=ax, label='Customers')
+	ax.set_xlabel("Annual Income")
+	ax.set_ylabel("Total Spending")
+	return fig
+
+
+def channel_chart(channel_df):
+	"""Bar chart of purchases per channel"""
+	fig = Figure()
+	ax = fig.subplots()
+	sns.barplot(x='Total Purchases', y='Channel', data=channel_df, ax=ax, palette="mako")
+	ax.set_xlabel("Total Purchases")
+	ax.set_ylabel("Channel")
+	return fig
+
+
+def _mean_spend_chart(series, color, xlabel, ylabel='Average Total Spend'):
+	fig = Figure()
+	ax = fig.subplots()
+	series.plot(kind='bar', ax=ax, color=color)
+	ax.set_ylabel(ylabel)
+	ax.set_xlabel(xlabel)
+	return fig
+
+
+def education_spend_chart(edu_spend):
+	"""Average total spend per education level"""
+	return _mean_spend_chart(edu_spend, 'skyblue', 'Education Level')
+
+
+def age_spend_chart(age_spend):
+	"""Average total spend per age group"""
+	return _mean_spend_chart(age_spend, 'coral', 'Age Group')
+
+
+def marital_spend_chart(marital_spend):
+	"""Average total spend per marital status"""
+	return _mean_spend_chart(marital_spend, 'mediumseagreen', 'Marital Status')
+
+
+def campaign_chart(campaign_acceptance):
+	"""Number of acceptances per campaign"""
+	return _mean_spend_chart(campaign_acceptance, 'slateblue', 'Campaign', ylabel='Number of Acceptances')
+
+
+def web_visits_chart(data):
+	"""Box plot of total spend per number of web visits"""
+	fig = Figure()
+	ax = fig.subplots()
+	sns.boxplot(x=data['web_visits_last_month'], y=data['TotalSpend'], ax=ax)
+	ax.set_xlabel('Web Visits Last Month')
+	ax.set_ylabel('Total Spend')
+	return fig
+
+
+def web_visits_box_stats_chart(stats):
+	"""Box plot of total spend per number of web visits from precomputed quantiles"""
+	fig = Figure()
+	ax = fig.subplots()
+	ax.bxp(stats.to_dict('records'), showfliers=False, patch_artist=True, boxprops={'facecolor': 'steelblue'})
+	ax.set_xlabel('Web Visits Last Month')
+	ax.set_ylabel('Total Spend')
+	return fig
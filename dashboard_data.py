@@ -0,0 +1,77 @@
+"""
+Data layer for the Retail Buyer Segmentation dashboard.
+
+Loads the customer data and precomputes every aggregate the dashboard draws
+into one compact summary dict. The dashboard caches the summary on the data
+file's content hash, which is itself only recomputed when the file's mtime or
+size changes, so Streamlit reruns just redraw.
+"""
+
+import os
+import pandas as pd
+
+from columnar import load_customers
+from segmentation import SPEND_COLS
+from visualizations import LARGE_DATA_THRESHOLD, histogram_2d, box_stats
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data', 'data.csv')
+
+CHANNELS = {
+	'num_store_purchases': 'Store',
+	'num_web_purchases': 'Web',
+	'num_catalog_purchases': 'Catalog',
+	'num_discount_purchases': 'Deals'
+}
+
+AGE_BINS = [18, 30, 40, 50, 60, 70, 100]
+AGE_LABELS = ['18-29', '30-39', '40-49', '50-59', '60-69', '70+']
+
+# Only these columns are read from the columnar store
+SUMMARY_COLS = SPEND_COLS + list(CHANNELS) + [
+	'annual_income', 'birth_year', 'education_level', 'marital_status', 'web_visits_last_month',
+	'accepted_campaign_1', 'accepted_campaign_2', 'accepted_campaign_3', 'accepted_campaign_4', 'accepted_campaign_5'
+]
+
+
+def file_signature(path=DATA_PATH):
+	"""Cheap (mtime_ns, size) signature used to decide when to rehash the file"""
+	stat = os.stat(path)
+	return stat.st_mtime_ns, stat.st_size
+
+
+def build_summary(data):
+	"""Compute every dashboard aggregate from the raw customer frame"""
+	total_spend = data[SPEND_COLS].sum(axis=1)
+
+	channel_totals = {v: data[k].sum() for k, v in CHANNELS.items() if k in data.columns}
+	age_group = pd.cut(2025 - data['birth_year'], bins=AGE_BINS, labels=AGE_LABELS, right=False)
+	campaign_cols = [col for col in data.columns if col.startswith('accepted_campaign_')]
+
+	summary = {
+		'rows': len(data),
+		'category_totals': data[SPEND_COLS].sum().sort_values(ascending=False),
+		'correlation': data['annual_income'].corr(total_spend),
+		'channel_df': pd.DataFrame(list(channel_totals.items()), columns=['Channel', 'Total Purchases']),
+		'edu_spend': total_spend.groupby(data['education_level'], observed=True).mean().sort_values(ascending=False),
+		'age_spend': total_spend.groupby(age_group, observed=False).mean(),
+		'marital_spend': total_spend.groupby(data['marital_status'], observed=True).mean().sort_values(ascending=False),
+		'campaign_acceptance': data[campaign_cols].sum(),
+	}
+
+	# Large datasets are drawn from binned density and precomputed quantiles
+	spend_frame = pd.DataFrame({'annual_income': data['annual_income'],
+	                            'web_visits_last_month': data['web_visits_last_month'],
+	                            'TotalSpend': total_spend})
+	summary['large'] = len(data) > LARGE_DATA_THRESHOLD
+	if summary['large']:
+		summary['income_spend'] = histogram_2d(spend_frame['annual_income'], spend_frame['TotalSpend'])
+		summary['web_visits_spend'] = box_stats(spend_frame, 'web_visits_last_month', 'TotalSpend')
+	else:
+		summary['income_spend'] = spend_frame[['annual_income', 'TotalSpend']]
+		summary['web_visits_spend'] = spend_frame[['web_visits_last_month', 'TotalSpend']]
+	return summary
+
+
+def load_summary(path=DATA_PATH):
+	"""Load the data file through its typed Parquet copy and return its summary"""
+	return build_summary(load_customers(path, columns=SUMMARY_COLS))
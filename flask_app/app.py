@@ -4,41 +4,89 @@ Author: AI Assistant
 Date: 2025
 """
 
+import time
+_boot_start = time.perf_counter()
+
 import os
 import json
+import uuid
+import cProfile
+import importlib
+import threading
+import multiprocessing
+from types import SimpleNamespace
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import seaborn as sns
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Request, Response, render_template, request, redirect, url_for, flash, jsonify, current_app, g
 from werkzeug.utils import secure_filename
-from sklearn.preprocessing import LabelEncoder, PowerTransformer, MinMaxScaler
-from sklearn.cluster import KMeans
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.naive_bayes import GaussianNB
-from xgboost import XGBClassifier
 import warnings
-import pickle
+from segmentation import preprocess_data, customer_features
+from model_registry import ModelRegistry, DEFAULT_DATA_PATH
+from batching import MicroBatcher
+from result_cache import ResultCache, PredictionCache, file_sha256
+from explorer import DatasetStore, explorer_frame, query, json_rows
+from similarity import load_or_build_reference, MAX_NEIGHBORS
+from serving import SharedModels, publish, current_version, DEFAULT_SERVING_DIR
+from metrics import metrics
+from segmentation_model import SegmentationModel
+from streaming import stream_segment_csv
+from visualizations import generate_visualizations
+from jobs import JobQueue, process_upload
+from rendering import get_render_pool
 warnings.filterwarnings('ignore')
 
+class SegmentationRequest(Request):
+    """Request that allows larger bodies on the JSON API than on HTML forms"""
+
+    @property
+    def max_content_length(self):
+        if self.path.startswith('/api/'):
+            return current_app.config['API_MAX_CONTENT_LENGTH']
+        if self.path == '/upload_stream':
+            return current_app.config['STREAM_MAX_CONTENT_LENGTH']
+        return super().max_content_length
+
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = SegmentationRequest
 app.secret_key = 'retail_segmentation_secret_key_2025'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['STATIC_FOLDER'] = 'static'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['API_MAX_CONTENT_LENGTH'] = 128 * 1024 * 1024  # 128MB max JSON batch
+app.config['STREAM_MAX_CONTENT_LENGTH'] = None  # No cap, streamed uploads are read in chunks
+app.config['STREAM_CHUNK_SIZE'] = 50000  # Rows per chunk in streaming mode
 app.config['ALLOWED_EXTENSIONS'] = {'csv'}
+app.config['IMAGE_FOLDER'] = os.path.join(app.config['STATIC_FOLDER'], 'images')
+app.config['ASYNC_UPLOADS'] = True  # Process uploads on the background job queue
+app.config['JOB_DATABASE'] = 'jobs.db'
+app.config['JOB_WORKERS'] = None  # Defaults to one less than the CPU count
+app.config['RENDER_WORKERS'] = 4  # Chart rendering processes of the web process, 0 renders in the request thread
+app.config['RENDER_POOL_WARMUP'] = True  # Start them at startup when ASYNC_UPLOADS is off
+app.config['API_DEFAULT_MODEL'] = 'lr'  # Classifier used by /api/v1/predict when none is given
+app.config['PREDICT_BATCHING'] = True  # Score concurrent single-customer predictions together
+app.config['PREDICT_MAX_BATCH_SIZE'] = 64
+app.config['PREDICT_MAX_WAIT'] = 0.002  # Seconds a prediction waits for others to share its batch
+app.config['PREDICT_TIMEOUT'] = 5.0  # Seconds a batched prediction may take before the request fails
+app.config['COMPILED_TREES'] = True  # Score tree classifiers with the NumPy evaluator instead of sklearn/xgboost
+app.config['RESULT_CACHE_DIR'] = os.path.join('cache', 'results')
+app.config['RESULT_CACHE_MAX_ENTRIES'] = 200  # Processed uploads kept on disk
+app.config['PREDICTION_CACHE_SIZE'] = 10000  # Single-customer predictions kept in memory, 0 disables
+app.config['DATASET_DIR'] = os.path.join('cache', 'datasets')
+app.config['DATASET_MAX_ENTRIES'] = 200  # Segmented uploads kept on disk for the data explorer
+app.config['EXPLORER_PAGE_SIZE'] = 50  # Rows per data explorer page unless the client asks otherwise
+app.config['SIMILAR_NEIGHBORS'] = 50  # Customers returned by /api/v1/similar unless the client asks otherwise
+app.config['PROFILING'] = False  # Allow ?profile=1 to dump a cProfile file for that request
+app.config['PROFILE_FOLDER'] = 'profiles'
+app.config['FROZEN_SEGMENTS'] = True  # Assign uploads to the saved segments instead of refitting K-Means
+app.config['STARTUP_WARMUP'] = True  # Load models and heavy libraries in the background after startup
+app.config['SHARED_MODELS'] = False  # Serve the published memory-mapped model bundle shared by all workers
+app.config['SERVING_DIR'] = DEFAULT_SERVING_DIR
+app.config['MODEL_RELOAD_INTERVAL'] = 5.0  # Seconds between checks for a newly published bundle
 
 # Create necessary directories
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(os.path.join(app.config['STATIC_FOLDER'], 'images'), exist_ok=True)
+os.makedirs(app.config['IMAGE_FOLDER'], exist_ok=True)
 
 # Available models matching notebook
 AVAILABLE_MODELS = {
@@ -50,143 +98,287 @@ AVAILABLE_MODELS = {
     'Naive Bayes': 'nb'
 }
 
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+# Libraries that requests would otherwise import on first use
+WARMUP_MODULES = ['sklearn.cluster', 'sklearn.metrics', 'xgboost', 'matplotlib.figure', 'pyarrow.parquet']
 
-def preprocess_data(df):
-    """Preprocess the input data"""
-    # Feature engineering
-    df['age'] = 2014 - df['birth_year'] if 'birth_year' in df.columns else df.get('age', 0)
-    
-    # Total spend
-    spend_cols = ['spend_wine', 'spend_fruits', 'spend_meat', 'spend_fish', 'spend_sweets', 'spend_gold']
-    if all(col in df.columns for col in spend_cols):
-        df['total_spent'] = df[spend_cols].sum(axis=1)
-    
-    # Total purchases
-    purchase_cols = ['num_discount_purchases', 'num_web_purchases', 'num_catalog_purchases', 'num_store_purchases']
-    if all(col in df.columns for col in purchase_cols):
-        df['total_purchases'] = df[purchase_cols].sum(axis=1)
-    
-    # Handle missing values
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        if df[col].isnull().any():
-            df[col].fillna(df[col].median(), inplace=True)
-    
-    categorical_cols = df.select_dtypes(include=['object']).columns
-    for col in categorical_cols:
-        if df[col].isnull().any():
-            df[col].fillna(df[col].mode()[0] if len(df[col].mode()) > 0 else 'Unknown', inplace=True)
-    
-    return df
-
-def perform_clustering(df):
-    """Perform K-Means clustering with 2 clusters (matching notebook)"""
-    # Select all 23 features for clustering (matching notebook)
-    clustering_features = [col for col in [
-        'education_level', 'annual_income', 'num_children', 'num_teenagers',
-        'days_since_last_purchase', 'spend_wine', 'spend_fruits', 'spend_meat',
-        'spend_fish', 'spend_sweets', 'spend_gold', 'num_discount_purchases',
-        'num_web_purchases', 'num_catalog_purchases', 'num_store_purchases',
-        'web_visits_last_month', 'total_accepted_campaigns', 'age',
-        'signup_year', 'total_spent', 'total_purchases', 'children', 'family_size'
-    ] if col in df.columns]
+_models = None
+_models_lock = threading.Lock()
+
+# Published model bundle attached by every worker process, in shared mode
+shared_models = (SharedModels(app.config['SERVING_DIR'], app.config['MODEL_RELOAD_INTERVAL'])
+                 if app.config['SHARED_MODELS'] else None)
+
+def _load_models():
+    """Load the classifier registry, its prediction front-end and the frozen segmentation model"""
+    start = time.perf_counter()
     
-    if not clustering_features:
-        return None, None
+    # Fitted classifier pipelines, trained once and then loaded from disk
+    try:
+        registry = ModelRegistry.load_or_train()
+        if app.config['COMPILED_TREES']:
+            registry = registry.compiled()
+        print(f"Loaded model registry {registry.version}")
+    except Exception as e:
+        registry = None
+        print(f"WARNING: model registry unavailable: {str(e)}")
     
-    # Prepare data
-    X = df[clustering_features].copy()
+    predictor, batcher = _predictor(registry)
     
-    # Scale features
-    scaler = MinMaxScaler()
-    X_scaled = scaler.fit_transform(X)
+    # Frozen segmentation model that uploads and the API are assigned against;
+    # the first one is taken from the model registry
+    try:
+        segmentation = SegmentationModel.load_current()
+        if segmentation is None and registry is not None:
+            segmentation = registry.segmenter
+            segmentation.make_current()
+        if segmentation is not None:
+            print(f"Loaded segmentation model {segmentation.version}")
+    except Exception as e:
+        segmentation = None
+        print(f"WARNING: segmentation model unavailable: {str(e)}")
     
-    # Perform clustering with 2 clusters (matching notebook)
-    kmeans = KMeans(n_clusters=2, init='k-means++', n_init='auto', random_state=0)
-    clusters = kmeans.fit_predict(X_scaled)
+    # Similar-customer index of the reference customers, saved next to the segmentation model
+    similarity = None
+    if segmentation is not None:
+        try:
+            similarity = load_or_build_reference(segmentation, DEFAULT_DATA_PATH)
+        except Exception as e:
+            print(f"WARNING: similar-customer index unavailable: {str(e)}")
     
-    return clusters, clustering_features
+    print(f"Models loaded in {time.perf_counter() - start:.2f}s")
+    return SimpleNamespace(registry=registry, predictor=predictor, batcher=batcher, segmentation=segmentation,
+                           similarity=similarity, version=None)
 
-def generate_visualizations(df, clusters=None):
-    """Generate visualizations and save them"""
-    plots = []
-    
-    # 1. Age Distribution
-    plt.figure(figsize=(10, 6))
-    if 'age' in df.columns:
-        plt.hist(df['age'], bins=30, color='#dc143c', edgecolor='white', alpha=0.7)
-        plt.xlabel('Age', color='white')
-        plt.ylabel('Frequency', color='white')
-        plt.title('Age Distribution', color='white', fontsize=16, fontweight='bold')
-        plt.grid(True, alpha=0.3)
-        plt.gca().set_facecolor('#1a1a1a')
-        plt.gcf().patch.set_facecolor('#1a1a1a')
-        plt.tick_params(colors='white')
-        plot_path = os.path.join(app.config['STATIC_FOLDER'], 'images', 'age_distribution.png')
-        plt.savefig(plot_path, facecolor='#1a1a1a', bbox_inches='tight')
-        plt.close()
-        plots.append('age_distribution.png')
-    
-    # 2. Income vs Total Spent
-    if 'annual_income' in df.columns and 'total_spent' in df.columns:
-        plt.figure(figsize=(10, 6))
-        plt.scatter(df['annual_income'], df['total_spent'], alpha=0.6, c='#dc143c', edgecolors='white')
-        plt.xlabel('Annual Income', color='white')
-        plt.ylabel('Total Spent', color='white')
-        plt.title('Income vs Total Spending', color='white', fontsize=16, fontweight='bold')
-        plt.grid(True, alpha=0.3)
-        plt.gca().set_facecolor('#1a1a1a')
-        plt.gcf().patch.set_facecolor('#1a1a1a')
-        plt.tick_params(colors='white')
-        plot_path = os.path.join(app.config['STATIC_FOLDER'], 'images', 'income_vs_spend.png')
-        plt.savefig(plot_path, facecolor='#1a1a1a', bbox_inches='tight')
-        plt.close()
-        plots.append('income_vs_spend.png')
-    
-    # 3. Cluster Distribution (if clusters exist)
-    if clusters is not None:
-        plt.figure(figsize=(10, 6))
-        cluster_counts = pd.Series(clusters).value_counts().sort_index()
-        plt.bar(cluster_counts.index, cluster_counts.values, color='#dc143c', edgecolor='white')
-        plt.xlabel('Cluster', color='white')
-        plt.ylabel('Count', color='white')
-        plt.title('Customer Segments Distribution', color='white', fontsize=16, fontweight='bold')
-        plt.grid(True, alpha=0.3, axis='y')
-        plt.gca().set_facecolor('#1a1a1a')
-        plt.gcf().patch.set_facecolor('#1a1a1a')
-        plt.tick_params(colors='white')
-        plot_path = os.path.join(app.config['STATIC_FOLDER'], 'images', 'cluster_distribution.png')
-        plt.savefig(plot_path, facecolor='#1a1a1a', bbox_inches='tight')
-        plt.close()
-        plots.append('cluster_distribution.png')
-    
-    # 4. Spending by Category
-    spend_cols = [col for col in ['spend_wine', 'spend_fruits', 'spend_meat', 
-                                    'spend_fish', 'spend_sweets', 'spend_gold'] if col in df.columns]
-    if spend_cols:
-        plt.figure(figsize=(12, 6))
-        spending_means = df[spend_cols].mean()
-        colors_list = ['#dc143c', '#ff6b6b', '#c41e3a', '#ee4b2b', '#cd5c5c', '#b22222']
-        plt.bar(range(len(spending_means)), spending_means.values, 
-                color=colors_list[:len(spending_means)], edgecolor='white')
-        plt.xticks(range(len(spending_means)), 
-                   [col.replace('spend_', '').title() for col in spending_means.index],
-                   rotation=45, ha='right', color='white')
-        plt.ylabel('Average Spending', color='white')
-        plt.title('Average Spending by Category', color='white', fontsize=16, fontweight='bold')
-        plt.grid(True, alpha=0.3, axis='y')
-        plt.gca().set_facecolor('#1a1a1a')
-        plt.gcf().patch.set_facecolor('#1a1a1a')
-        plt.tick_params(colors='white')
-        plot_path = os.path.join(app.config['STATIC_FOLDER'], 'images', 'spending_by_category.png')
-        plt.savefig(plot_path, facecolor='#1a1a1a', bbox_inches='tight')
-        plt.close()
-        plots.append('spending_by_category.png')
+def _predictor(registry):
+    """Return (predictor, batcher): the prediction front-end of a registry and its micro-batcher, if any"""
+    # Single-customer predictions go through the micro-batcher when enabled
+    predictor = registry
+    batcher = None
+    if registry is not None and app.config['PREDICT_BATCHING']:
+        predictor = batcher = MicroBatcher(registry, app.config['PREDICT_MAX_BATCH_SIZE'],
+                                           app.config['PREDICT_MAX_WAIT'], app.config['PREDICT_TIMEOUT'])
+    if registry is not None and app.config['PREDICTION_CACHE_SIZE']:
+        predictor = PredictionCache(predictor, registry.features, registry.version,
+                                    app.config['PREDICTION_CACHE_SIZE'])
+    return predictor, batcher
+
+def _shared_models():
+    """Models of the current published bundle, rebuilt when a new version is published"""
+    global _models
+    bundle = shared_models.get()
+    if bundle is None:
+        # Nothing published yet: the first worker here publishes its models
+        with _models_lock:
+            if current_version(app.config['SERVING_DIR']) is None:
+                local = _load_models()
+                if local.registry is None and local.segmentation is None:
+                    return local
+                publish(local.registry, local.segmentation, local.similarity, app.config['SERVING_DIR'])
+        bundle = shared_models.get()
     
-    return plots
+    models = _models
+    if models is None or models.version != bundle['version']:
+        with _models_lock:
+            if _models is None or _models.version != bundle['version']:
+                previous = _models
+                predictor, batcher = _predictor(bundle['registry'])
+                _models = SimpleNamespace(registry=bundle['registry'], predictor=predictor, batcher=batcher,
+                                          segmentation=bundle['segmentation'], similarity=bundle['similarity'],
+                                          version=bundle['version'])
+                # Requests holding the previous models finish with them; its
+                # batching threads exit once their queued predictions are answered
+                if previous is not None and previous.batcher is not None:
+                    previous.batcher.close()
+            models = _models
+    return models
+
+def load_models():
+    """Models shared by all requests, loaded by the first caller (usually the warm-up thread)"""
+    global _models
+    if shared_models is not None:
+        return _shared_models()
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                _models = _load_models()
+    return _models
+
+def warm_up():
+    """Load the models and import the heavy libraries before the first request needs them"""
+    start = time.perf_counter()
+    load_models()
+    for name in WARMUP_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+# Spawned job and render workers re-import the main module as __mp_main__
+# (before parent_process() is set), so only the web process itself warms up
+_web_process = __name__ != '__mp_main__' and multiprocessing.parent_process() is None
+
+# Process pool for the charts drawn in the web process (synchronous and
+# streamed uploads); job workers render their own charts inline. It is only
+# warmed up front when every upload renders here, streams start it on demand
+render_pool = get_render_pool(app.config['RENDER_WORKERS']) if app.config['RENDER_WORKERS'] else None
+if render_pool is not None and app.config['RENDER_POOL_WARMUP'] and not app.config['ASYNC_UPLOADS'] and _web_process:
+    render_pool.warm_in_background()
+
+# Background queue for upload processing
+job_queue = JobQueue(app.config['JOB_DATABASE'], app.config['JOB_WORKERS'])
+
+# Processed uploads by content hash, so re-uploading a file skips the pipeline
+result_cache = ResultCache(app.config['RESULT_CACHE_DIR'], app.config['RESULT_CACHE_MAX_ENTRIES'])
+
+# Segmented rows of processed uploads, browsed page by page from the insights page
+dataset_store = DatasetStore(app.config['DATASET_DIR'], app.config['DATASET_MAX_ENTRIES'])
+
+if app.config['STARTUP_WARMUP'] and _web_process:
+    threading.Thread(target=warm_up, name='startup-warmup', daemon=True).start()
+print(f"App module ready in {time.perf_counter() - _boot_start:.2f}s")
+
+# Segment descriptions shown with every prediction; cluster 0 is the
+# highest-spending segment (see fit_clustering)
+SEGMENT_PROFILES = {
+    0: {
+        'segment': "High-Value Segment",
+        'segment_description': "Premium customers with high spending and strong engagement",
+        'segment_color': "success",
+        'cluster_profile': {
+            'cluster_id': 0,
+            'cluster_name': 'Cluster 0: Premium High-Value Customers',
+            'characteristics': [
+                'High total spending (> $800)',
+                'Above-average income levels',
+                'Frequent purchasers across multiple channels',
+                'Strong engagement with premium products',
+                'Responsive to exclusive offers'
+            ],
+            'typical_behavior': [
+                'Prefers quality over price',
+                'Often purchases wine, meat, and gold products',
+                'Uses multiple shopping channels (web, catalog, store)',
+                'Lower sensitivity to discounts',
+                'Higher campaign acceptance rate'
+            ],
+            'demographics': [
+                'Average Age: 45-55 years',
+                'Income: $60,000+',
+                'Education: Graduate/Postgraduate',
+                'Family: Usually smaller households (1-3 members)'
+            ],
+            'marketing_strategy': [
+                'Offer VIP loyalty programs with exclusive benefits',
+                'Provide personalized product recommendations',
+                'Send early access to new premium products',
+                'Focus on quality and exclusivity in communications',
+                'Maintain high-touch customer service'
+            ],
+            'retention_tips': [
+                'Create exclusive membership tiers',
+                'Offer premium gift options and packaging',
+                'Provide dedicated customer support',
+                'Send personalized thank-you notes',
+                'Host exclusive events or tastings'
+            ]
+        }
+    },
+    1: {
+        'segment': "Standard Segment",
+        'segment_description': "Regular customers with moderate spending patterns",
+        'segment_color': "info",
+        'cluster_profile': {
+            'cluster_id': 1,
+            'cluster_name': 'Cluster 1: Standard Value-Conscious Customers',
+            'characteristics': [
+                'Moderate spending (≤ $800)',
+                'Budget-conscious purchasing behavior',
+                'Price-sensitive decision making',
+                'Selective purchasing patterns',
+                'Values deals and promotions'
+            ],
+            'typical_behavior': [
+                'Looks for best value and discounts',
+                'Purchases essential items regularly',
+                'Higher discount purchase rate',
+                'More selective about premium products',
+                'Responds well to promotional campaigns'
+            ],
+            'demographics': [
+                'Average Age: 30-45 years',
+                'Income: $30,000-$60,000',
+                'Education: Varies (Undergraduate to Graduate)',
+                'Family: Often larger households (3-5 members)'
+            ],
+            'marketing_strategy': [
+                'Highlight value propositions and savings',
+                'Send targeted discount offers and bundle deals',
+                'Emphasize cost-effectiveness in communications',
+                'Promote loyalty rewards programs',
+                'Focus on seasonal sales and special promotions'
+            ],
+            'retention_tips': [
+                'Implement points-based rewards system',
+                'Offer bulk purchase discounts',
+                'Send birthday/anniversary coupons',
+                'Create value bundles and packages',
+                'Provide free shipping thresholds'
+            ]
+        }
+    }
+}
+
+SPEND_CATEGORY_NAMES = {
+    'spend_wine': 'Wine',
+    'spend_fruits': 'Fruits',
+    'spend_meat': 'Meat',
+    'spend_fish': 'Fish',
+    'spend_sweets': 'Sweets',
+    'spend_gold': 'Gold'
+}
+
+def segment_profile(prediction):
+    """Profile of a predicted segment; every segment after the first is a standard one"""
+    return SEGMENT_PROFILES[0 if prediction == 0 else 1]
+
+def customer_metrics(features):
+    """Derived metrics reported with a single-customer prediction"""
+    top_column = max(SPEND_CATEGORY_NAMES, key=features.get)
+    return {
+        'total_spent': features['total_spent'],
+        'total_purchases': int(features['total_purchases']),
+        'avg_purchase_value': features['total_spent'] / max(features['total_purchases'], 1),
+        'top_category': SPEND_CATEGORY_NAMES[top_column]
+    }
+
+@app.before_request
+def start_request_instrumentation():
+    """Start the request timer and, when asked for, the profiler"""
+    g.request_start = time.perf_counter()
+    if app.config['PROFILING'] and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request_instrumentation(response):
+    """Record the request latency and write the profile of a profiled request"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
+        path = os.path.join(app.config['PROFILE_FOLDER'],
+                            f"{request.endpoint or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof")
+        # Open with python -m pstats, snakeviz or flameprof
+        profiler.dump_stats(path)
+        response.headers['X-Profile-File'] = path
+    if 'request_start' in g and request.endpoint != 'metrics_endpoint':
+        metrics.record('http', request.endpoint or 'unknown', time.perf_counter() - g.request_start)
+    return response
+
+def allowed_file(filename):
+    """Check if file extension is allowed"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 @app.route('/')
 @app.route('/index')
@@ -203,181 +395,37 @@ def manual_input():
 def predict_manual():
     """Handle manual input prediction with model selection"""
     try:
-        print("=" * 50)
-        print("Predict Manual Route Called")
-        print("=" * 50)
-        
-        # Get selected model
         selected_model = request.form.get('model', 'Random Forest')
-        print(f"Selected Model: {selected_model}")
-        
-        # Extract all input features
-        education_level = int(request.form.get('education_level', 0))
-        annual_income = float(request.form.get('annual_income', 0))
-        num_children = int(request.form.get('num_children', 0))
-        num_teenagers = int(request.form.get('num_teenagers', 0))
-        days_since_last_purchase = int(request.form.get('days_since_last_purchase', 30))
-        spend_wine = float(request.form.get('spend_wine', 0))
-        spend_fruits = float(request.form.get('spend_fruits', 0))
-        spend_meat = float(request.form.get('spend_meat', 0))
-        spend_fish = float(request.form.get('spend_fish', 0))
-        spend_sweets = float(request.form.get('spend_sweets', 0))
-        spend_gold = float(request.form.get('spend_gold', 0))
-        num_discount_purchases = int(request.form.get('num_discount_purchases', 0))
-        num_web_purchases = int(request.form.get('num_web_purchases', 0))
-        num_catalog_purchases = int(request.form.get('num_catalog_purchases', 0))
-        num_store_purchases = int(request.form.get('num_store_purchases', 0))
-        web_visits_last_month = int(request.form.get('web_visits_last_month', 0))
-        total_accepted_campaigns = int(request.form.get('total_accepted_campaigns', 0))
-        age = int(request.form.get('age', 0))
-        signup_year = int(request.form.get('signup_year', 2013))
-        marital_status = request.form.get('marital_status', 'Single')
-        
-        print(f"Age: {age}, Income: {annual_income}")
-        
-        # Calculate derived features
-        total_spent = spend_wine + spend_fruits + spend_meat + spend_fish + spend_sweets + spend_gold
-        total_purchases = num_discount_purchases + num_web_purchases + num_catalog_purchases + num_store_purchases
-        children = num_children + num_teenagers
-        family_size = children + (2 if marital_status == 'Partner' else 1)
-        
-        print(f"Total Spent: ${total_spent:.2f}, Total Purchases: {total_purchases}")
-        
-        # Rule-based prediction (2 clusters matching notebook)
-        if total_spent > 800:
-            prediction = 0
-            segment = "High-Value Segment"
-            segment_desc = "Premium customers with high spending and strong engagement"
-            color = "success"
-            
-            # Cluster 0 detailed profile
-            cluster_profile = {
-                'cluster_id': 0,
-                'cluster_name': 'Cluster 0: Premium High-Value Customers',
-                'characteristics': [
-                    'High total spending (> $800)',
-                    'Above-average income levels',
-                    'Frequent purchasers across multiple channels',
-                    'Strong engagement with premium products',
-                    'Responsive to exclusive offers'
-                ],
-                'typical_behavior': [
-                    'Prefers quality over price',
-                    'Often purchases wine, meat, and gold products',
-                    'Uses multiple shopping channels (web, catalog, store)',
-                    'Lower sensitivity to discounts',
-                    'Higher campaign acceptance rate'
-                ],
-                'demographics': [
-                    'Average Age: 45-55 years',
-                    'Income: $60,000+',
-                    'Education: Graduate/Postgraduate',
-                    'Family: Usually smaller households (1-3 members)'
-                ],
-                'marketing_strategy': [
-                    'Offer VIP loyalty programs with exclusive benefits',
-                    'Provide personalized product recommendations',
-                    'Send early access to new premium products',
-                    'Focus on quality and exclusivity in communications',
-                    'Maintain high-touch customer service'
-                ],
-                'retention_tips': [
-                    'Create exclusive membership tiers',
-                    'Offer premium gift options and packaging',
-                    'Provide dedicated customer support',
-                    'Send personalized thank-you notes',
-                    'Host exclusive events or tastings'
-                ]
-            }
-        else:
-            prediction = 1
-            segment = "Standard Segment"
-            segment_desc = "Regular customers with moderate spending patterns"
-            color = "info"
-            
-            # Cluster 1 detailed profile
-            cluster_profile = {
-                'cluster_id': 1,
-                'cluster_name': 'Cluster 1: Standard Value-Conscious Customers',
-                'characteristics': [
-                    'Moderate spending (≤ $800)',
-                    'Budget-conscious purchasing behavior',
-                    'Price-sensitive decision making',
-                    'Selective purchasing patterns',
-                    'Values deals and promotions'
-                ],
-                'typical_behavior': [
-                    'Looks for best value and discounts',
-                    'Purchases essential items regularly',
-                    'Higher discount purchase rate',
-                    'More selective about premium products',
-                    'Responds well to promotional campaigns'
-                ],
-                'demographics': [
-                    'Average Age: 30-45 years',
-                    'Income: $30,000-$60,000',
-                    'Education: Varies (Undergraduate to Graduate)',
-                    'Family: Often larger households (3-5 members)'
-                ],
-                'marketing_strategy': [
-                    'Highlight value propositions and savings',
-                    'Send targeted discount offers and bundle deals',
-                    'Emphasize cost-effectiveness in communications',
-                    'Promote loyalty rewards programs',
-                    'Focus on seasonal sales and special promotions'
-                ],
-                'retention_tips': [
-                    'Implement points-based rewards system',
-                    'Offer bulk purchase discounts',
-                    'Send birthday/anniversary coupons',
-                    'Create value bundles and packages',
-                    'Provide free shipping thresholds'
-                ]
-            }
-        
-        print(f"Prediction: {prediction}, Segment: {segment}")
-        
-        # Calculate metrics
-        avg_purchase = total_spent / max(total_purchases, 1)
+        models = load_models()
+        if models.registry is None:
+            raise RuntimeError('Prediction models are not available')
+        with metrics.stage('predict_manual', 'features', rows=1):
+            features = customer_features(request.form, models.registry.segmenter.encoder)
         
-        # Find top spending category
-        spending_data = {
-            'Wine': spend_wine,
-            'Fruits': spend_fruits,
-            'Meat': spend_meat,
-            'Fish': spend_fish,
-            'Sweets': spend_sweets,
-            'Gold': spend_gold
-        }
-        top_category = max(spending_data, key=spending_data.get)
+        # Model-based prediction with the selected pre-trained classifier
+        with metrics.stage('predict_manual', 'predict', rows=1):
+            prediction = models.predictor.predict(AVAILABLE_MODELS.get(selected_model, 'rf'), features)
+        derived = customer_metrics(features)
         
-        # Prepare insights
         insights = {
             'model': selected_model,
             'prediction': prediction,
-            'segment': segment,
-            'segment_description': segment_desc,
-            'segment_color': color,
-            'total_spent': f"${total_spent:.2f}",
-            'total_purchases': int(total_purchases),
-            'avg_purchase_value': f"${avg_purchase:.2f}",
-            'top_category': top_category,
-            'age': age,
-            'income': f"${annual_income:.2f}",
-            'family_size': family_size,
-            'web_visits': web_visits_last_month,
-            'cluster_profile': cluster_profile
+            'total_spent': f"${derived['total_spent']:.2f}",
+            'total_purchases': derived['total_purchases'],
+            'avg_purchase_value': f"${derived['avg_purchase_value']:.2f}",
+            'top_category': derived['top_category'],
+            'age': int(features['age']),
+            'income': f"${features['annual_income']:.2f}",
+            'family_size': int(features['family_size']),
+            'web_visits': int(features['web_visits_last_month']),
+            **segment_profile(prediction)
         }
         
-        print("Insights prepared successfully")
-        print("Rendering results.html")
-        
-        return render_template('results.html', insights=insights, manual=True)
+        with metrics.stage('predict_manual', 'render', rows=1):
+            return render_template('results.html', insights=insights, manual=True)
         
     except Exception as e:
         print(f"ERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
         flash(f'Error processing input: {str(e)}', 'error')
         return redirect(url_for('manual_input'))
 
@@ -397,44 +445,36 @@ def upload_file():
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Read CSV
-            df = pd.read_csv(filepath)
-            
-            # Preprocess
-            df = preprocess_data(df)
-            
-            # Perform clustering
-            clusters, clustering_features = perform_clustering(df)
-            
-            if clusters is not None:
-                df['cluster'] = clusters
-            
-            # Generate statistics
-            stats = {
-                'total_customers': len(df),
-                'avg_income': f"${df['annual_income'].mean():.2f}" if 'annual_income' in df.columns else 'N/A',
-                'avg_age': f"{df['age'].mean():.1f}" if 'age' in df.columns else 'N/A',
-                'total_revenue': f"${df['total_spent'].sum():.2f}" if 'total_spent' in df.columns else 'N/A',
-                'avg_spending': f"${df['total_spent'].mean():.2f}" if 'total_spent' in df.columns else 'N/A',
-            }
+            # Unique prefix so concurrent uploads of the same name don't collide
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+            with metrics.stage('upload', 'save'):
+                file.save(filepath)
             
-            if clusters is not None:
-                stats['num_segments'] = len(np.unique(clusters))
+            segmenter = load_models().segmentation if app.config['FROZEN_SEGMENTS'] else None
+            with metrics.stage('upload', 'cache_lookup'):
+                cache_key = ResultCache.key(file_sha256(filepath), segmenter.version if segmenter else 'refit')
+                cached = result_cache.get(cache_key, app.config['IMAGE_FOLDER'])
+                if cached is not None and not dataset_store.exists(cached['dataset_id']):
+                    cached = None
+            if cached is not None:
+                os.remove(filepath)
             
-            # Generate visualizations
-            plots = generate_visualizations(df, clusters)
+            if not app.config['ASYNC_UPLOADS']:
+                result = cached or process_upload(filepath, app.config['IMAGE_FOLDER'], render_pool=render_pool,
+                                                  segmenter=segmenter, cache=result_cache, cache_key=cache_key,
+                                                  datasets=dataset_store)
+                return render_template('insights.html', filename=filename, **result)
             
-            # Get sample data
-            sample_data = df.head(10).to_html(classes='table table-dark table-striped', index=False)
-            
-            return render_template('insights.html', 
-                                   stats=stats, 
-                                   plots=plots, 
-                                   sample_data=sample_data,
-                                   filename=filename)
+            if cached is not None:
+                # Repeat uploads finish immediately, clients poll the job as usual
+                job_id = job_queue.complete(filename, cached)
+            else:
+                # Process in the background and hand back the job ID right away
+                job_id = job_queue.submit(filepath, filename, app.config['IMAGE_FOLDER'], segmenter,
+                                          result_cache, cache_key, dataset_store)
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+            return redirect(url_for('job_view', job_id=job_id))
         else:
             flash('Invalid file type. Please upload a CSV file.', 'error')
             return redirect(url_for('home'))
@@ -443,6 +483,218 @@ def upload_file():
         flash(f'Error processing file: {str(e)}', 'error')
         return redirect(url_for('home'))
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report per-stage progress of an upload job, with its result once done"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = {
+        'job_id': job['id'],
+        'filename': job['filename'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'stages': job['stages'],
+        'progress': job['progress'],
+        'error': job['error']
+    }
+    if job['status'] == 'done':
+        response['result'] = job['result']
+        response['insights_url'] = url_for('job_insights', job_id=job_id)
+    return jsonify(response)
+
+@app.route('/jobs/<job_id>/view')
+def job_view(job_id):
+    """Progress page that polls the job status"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        flash('Upload job not found', 'error')
+        return redirect(url_for('home'))
+    return render_template('job_status.html', job=job)
+
+@app.route('/jobs/<job_id>/insights')
+def job_insights(job_id):
+    """Render the insights page of a finished upload job"""
+    job = job_queue.store.get(job_id)
+    if job is None or job['status'] == 'failed':
+        flash(f"Error processing file: {job['error'] if job else 'job not found'}", 'error')
+        return redirect(url_for('home'))
+    if job['status'] != 'done':
+        return redirect(url_for('job_view', job_id=job_id))
+    return render_template('insights.html', filename=job['filename'], **job['result'])
+
+@app.route('/upload_stream', methods=['POST'])
+def upload_stream():
+    """Handle large CSV uploads chunk by chunk with bounded memory"""
+    try:
+        if 'file' not in request.files:
+            flash('No file uploaded', 'error')
+            return redirect(url_for('home'))
+        
+        file = request.files['file']
+        
+        if file.filename == '' or not allowed_file(file.filename):
+            flash('Invalid file type. Please upload a CSV file.', 'error')
+            return redirect(url_for('home'))
+        
+        segmenter = load_models().segmentation
+        if segmenter is None:
+            raise RuntimeError('Segmentation model is not available')
+        
+        # Werkzeug spools large uploads to a temporary file, so the stream is
+        # read straight from disk without another copy in uploads/
+        # Every segmented chunk is also kept for the data explorer
+        dataset_id = uuid.uuid4().hex
+        with dataset_store.writer(dataset_id) as writer:
+            stats, sample, totals = stream_segment_csv(file.stream, segmenter, chunksize=app.config['STREAM_CHUNK_SIZE'],
+                                                       sink=lambda chunk: writer.write(explorer_frame(chunk)))
+        dataset_store.evict()
+        
+        # Segment and category charts use the totals of every row; the age
+        # histogram and scatter are drawn from a bounded uniform sample
+        plots = generate_visualizations(sample, sample['cluster'].to_numpy(), app.config['IMAGE_FOLDER'],
+                                        render_pool=render_pool, totals=totals)
+        
+        return render_template('insights.html',
+                               stats=stats,
+                               plots=plots,
+                               dataset_id=dataset_id,
+                               filename=secure_filename(file.filename))
+    
+    except Exception as e:
+        flash(f'Error processing file: {str(e)}', 'error')
+        return redirect(url_for('home'))
+
+@app.route('/api/v1/segment', methods=['POST'])
+def api_segment():
+    """Assign a batch of customer records to the persisted segments"""
+    segmentation_model = load_models().segmentation
+    if segmentation_model is None:
+        return jsonify({'error': 'Segmentation model is not available'}), 503
+    
+    payload = request.get_json(silent=True)
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'Expected a non-empty JSON array of customer records'}), 400
+    
+    try:
+        df = preprocess_data(pd.DataFrame.from_records(records), segmentation_model.fill_values)
+    except Exception as e:
+        return jsonify({'error': f'Invalid customer records: {str(e)}'}), 400
+    
+    missing = segmentation_model.missing_features(df)
+    if missing:
+        return jsonify({'error': 'Missing required fields', 'missing': missing}), 400
+    
+    try:
+        clusters, distances = segmentation_model.assign(df)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid customer records: {str(e)}'}), 400
+    
+    response = {
+        'model_version': segmentation_model.version,
+        'count': len(df),
+        'clusters': clusters.tolist(),
+        'distances': np.round(distances, 6).tolist()
+    }
+    if 'customer_id' in df.columns:
+        response['customer_ids'] = df['customer_id'].tolist()
+    return jsonify(response)
+
+@app.route('/api/v1/predict', methods=['POST'])
+def api_predict():
+    """Score a single customer with a pre-trained classifier"""
+    models = load_models()
+    model_registry = models.registry
+    if model_registry is None:
+        return jsonify({'error': 'Prediction models are not available'}), 503
+    
+    customer = request.get_json(silent=True)
+    if not isinstance(customer, dict):
+        return jsonify({'error': 'Expected a JSON object with the customer fields'}), 400
+    
+    # Accept either the display name or the short code of a model
+    model_name = customer.get('model', app.config['API_DEFAULT_MODEL'])
+    model_code = AVAILABLE_MODELS.get(model_name, model_name)
+    if model_code not in model_registry.models:
+        return jsonify({'error': f'Unknown model: {model_name}', 'models': sorted(model_registry.models)}), 400
+    
+    try:
+        features = customer_features(customer, model_registry.segmenter.encoder)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid customer fields: {str(e)}'}), 400
+    
+    prediction = models.predictor.predict(model_code, features)
+    profile = segment_profile(prediction)
+    return jsonify({
+        'segment_id': prediction,
+        'segment': profile['segment'],
+        'model': model_code,
+        'model_version': model_registry.version,
+        **customer_metrics(features)
+    })
+
+@app.route('/api/v1/datasets/<dataset_id>/rows')
+def api_dataset_rows(dataset_id):
+    """One page of a segmented upload, sorted and filtered by the query string"""
+    dataset = dataset_store.load(dataset_id)
+    if dataset is None:
+        return jsonify({'error': 'Dataset not found'}), 404
+    
+    args = request.args
+    try:
+        page = query(dataset,
+                     page=args.get('page', 1, type=int),
+                     per_page=args.get('per_page', app.config['EXPLORER_PAGE_SIZE'], type=int),
+                     sort=args.get('sort') or None,
+                     descending=args.get('order', 'asc') == 'desc',
+                     cluster=args.get('cluster', type=int),
+                     min_income=args.get('min_income', type=float),
+                     max_income=args.get('max_income', type=float),
+                     category=args.get('category') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page['dataset_id'] = dataset_id
+    return jsonify(page)
+
+@app.route('/api/v1/similar/<int:customer_id>')
+def api_similar(customer_id):
+    """Customers most like one customer, from an uploaded dataset or the reference customers"""
+    dataset_id = request.args.get('dataset')
+    k = min(max(request.args.get('k', app.config['SIMILAR_NEIGHBORS'], type=int), 1), MAX_NEIGHBORS)
+    dataset = None
+    if dataset_id:
+        index = dataset_store.load_index(dataset_id)
+        dataset = dataset_store.load(dataset_id)
+    else:
+        index = load_models().similarity
+    if index is None:
+        return jsonify({'error': 'No similar-customer index for this dataset'}), 404
+    
+    try:
+        rows, distances = index.query(customer_id, k)
+    except KeyError:
+        return jsonify({'error': f'Customer not found: {customer_id}'}), 404
+    
+    response = {
+        'customer_id': customer_id,
+        'cluster': int(index.clusters[index.row_of(customer_id)]),
+        'model_version': index.model_version,
+        'count': len(rows),
+        'customer_ids': index.ids[rows].tolist(),
+        'distances': np.round(distances, 6).tolist()
+    }
+    if dataset is not None:
+        response['columns'] = list(dataset.frame.columns)
+        response['rows'] = json_rows(dataset.frame, rows)
+    return jsonify(response)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage latency, row and allocation metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/about')
 def about():
     """About page"""
@@ -0,0 +1,120 @@
+"""
+Micro-batching for Retail Buyer Segmentation predictions
+Collects concurrent single-customer predictions for up to a few milliseconds
+or a maximum number of rows and scores them with one vectorized
+predict_proba call per model, fanning the results back to the waiting
+requests. A batch is only held open while requests are arriving
+concurrently; a lone request is scored as soon as it is picked up.
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+MAX_BATCH_SIZE = 64
+MAX_WAIT = 0.002  # Seconds a batch stays open after its first request, under concurrent load
+TIMEOUT = 5.0  # Seconds predict waits for its batch before giving up
+
+class MicroBatcher:
+    """Drop-in replacement for ModelRegistry.predict that batches concurrent calls per model"""
+
+    def __init__(self, registry, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT, timeout=TIMEOUT):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queues = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _enqueue(self, model_code, values):
+        """Queue a request and return its future, or None once the batcher is closed"""
+        future = Future()
+        # Queued under the lock, so nothing can land behind close()'s sentinel
+        with self._lock:
+            if self._closed:
+                return None
+            if model_code not in self._queues:
+                self._queues[model_code] = queue.SimpleQueue()
+                threading.Thread(target=self._run, args=(model_code, self._queues[model_code]),
+                                 name=f'micro-batcher-{model_code}', daemon=True).start()
+            self._queues[model_code].put((values, future))
+        return future
+
+    def submit(self, model_code, values):
+        """Queue one customer's feature mapping and return a future of its segment"""
+        if model_code not in self.registry.models:
+            raise KeyError(model_code)
+        future = self._enqueue(model_code, values)
+        if future is None:
+            raise RuntimeError('MicroBatcher is closed')
+        return future
+
+    def close(self):
+        """Stop the batching threads once the predictions already queued are answered"""
+        with self._lock:
+            self._closed = True
+            for pending in self._queues.values():
+                pending.put(None)
+            self._queues = {}
+
+    def predict(self, model_code, values, timeout=None):
+        """Predict the segment of one customer, sharing a model call with concurrent requests"""
+        if model_code not in self.registry.models:
+            raise KeyError(model_code)
+        future = self._enqueue(model_code, values)
+        if future is None:
+            # A request that picked up this batcher before it was replaced
+            return self.registry.predict(model_code, values)
+        return future.result(timeout if timeout is not None else self.timeout)
+
+    def _collect(self, pending, wait):
+        """
+        Block for the first request, then gather the ones already queued.
+
+        With wait set, or when more than one request was queued, the batch
+        stays open for more until it is full or max_wait expires.
+        """
+        batch = [pending.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0 and (wait or len(batch) > 1):
+                    item = pending.get(timeout=remaining)
+                else:
+                    item = pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop after this batch
+                pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self, model_code, pending):
+        model = self.registry.models[model_code]
+        features = self.registry.features
+        concurrent = False
+        while True:
+            batch = self._collect(pending, concurrent)
+            if batch is None:
+                return
+            # Wait for company only while the previous batch had some
+            concurrent = len(batch) > 1
+            try:
+                X = np.empty((len(batch), len(features)))
+                for i, (values, _) in enumerate(batch):
+                    X[i] = [values.get(col, 0) for col in features]
+                labels = model.classes_[model.predict_proba(X).argmax(axis=1)]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for label, (_, future) in zip(labels, batch):
+                future.set_result(int(label))
@@ -0,0 +1,222 @@
+"""
+Benchmark suite for Retail Buyer Segmentation
+Generates synthetic customers with the Data/data.csv schema, times every
+pipeline stage and the Flask routes at several dataset sizes, records peak
+traced memory and writes the results as JSON so runs can be compared.
+
+Usage:
+    python benchmark.py [--sizes 10000 100000 1000000 10000000] [--output results.json]
+                        [--compare previous.json] [--threshold 1.2] [--repeat 3] [--no-memory] [--no-http]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+import sklearn
+
+from segmentation import preprocess_data, fit_clustering, SPEND_COLS
+from segmentation_model import SegmentationModel
+from columnar import convert_csv, read_table
+from visualizations import generate_visualizations
+from result_cache import ResultCache
+from explorer import DatasetStore
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_DATA = os.path.join(BASE_DIR, '..', 'Data', 'data.csv')
+DEFAULT_SIZES = [10000, 100000, 1000000, 10000000]
+SEED = 0
+HTTP_PREDICT_REQUESTS = 500
+DEFAULT_REPEAT = 3  # Runs per stage; the fastest one is reported
+REGRESSION_THRESHOLD = 1.2  # Slowdown ratio reported as a regression by --compare
+REGRESSION_MIN_SECONDS = 0.01  # Stages faster than this are too noisy to compare
+
+def synthetic_customers(n_rows, seed=SEED, reference=REFERENCE_DATA):
+    """
+    Return n_rows synthetic customers with the reference file's schema.
+
+    Rows are bootstrapped from the reference data, so categories, missing
+    values and correlations match it, with multiplicative noise on the spend
+    columns and fresh customer IDs. The same seed always gives the same frame.
+    """
+    rng = np.random.default_rng(seed)
+    ref = pd.read_csv(reference)
+    df = ref.iloc[rng.integers(0, len(ref), n_rows)].reset_index(drop=True)
+    noise = rng.uniform(0.8, 1.2, (n_rows, len(SPEND_COLS)))
+    df[SPEND_COLS] = np.rint(df[SPEND_COLS].to_numpy() * noise).astype(np.int64)
+    df['customer_id'] = np.arange(n_rows, dtype=np.int64)
+    return df
+
+def measure(fn, memory=True, repeat=DEFAULT_REPEAT):
+    """Run fn repeat times and return (result, fastest seconds, peak traced MB or None)"""
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds = min(seconds, time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        # Second, traced run: tracemalloc slows allocation-heavy code down
+        del result
+        tracemalloc.start()
+        result = fn()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+def benchmark_stages(n_rows, workdir, memory=True, repeat=DEFAULT_REPEAT):
+    """Time each pipeline stage on n_rows synthetic customers"""
+    results = []
+
+    def record(stage, fn):
+        result, seconds, peak_mb = measure(fn, memory, repeat)
+        results.append({'rows': n_rows, 'stage': stage, 'seconds': round(seconds, 4),
+                        'rows_per_second': round(n_rows / seconds) if seconds else None,
+                        'peak_mb': round(peak_mb, 1) if peak_mb is not None else None})
+        print(f"  {stage:<16} {seconds:9.3f}s" + (f"  {peak_mb:9.1f} MB" if peak_mb is not None else ''))
+        return result
+
+    raw = synthetic_customers(n_rows)
+    csv_path = os.path.join(workdir, f'customers-{n_rows}.csv')
+    raw.to_csv(csv_path, index=False)
+
+    record('parse_csv', lambda: pd.read_csv(csv_path))
+    parquet_path = record('convert_parquet', lambda: convert_csv(csv_path))
+    record('read_parquet', lambda: read_table(parquet_path))
+    df = record('preprocess', lambda: preprocess_data(raw))
+    clusters, _, _, _, _ = record('cluster', lambda: fit_clustering(df))
+    record('cluster_auto_k', lambda: fit_clustering(df, n_clusters='auto'))
+    model = record('fit_segmenter', lambda: SegmentationModel.fit(raw))
+    record('assign', lambda: model.assign(df))
+
+    def visualize():
+        # A fresh image directory per run, so every chart is rendered
+        image_dir = tempfile.mkdtemp(dir=workdir)
+        return generate_visualizations(df, clusters, image_dir)
+    record('visualize', visualize)
+    return results
+
+def _percentiles(latencies):
+    return {'p50_ms': round(float(np.percentile(latencies, 50)) * 1e3, 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)) * 1e3, 3)}
+
+def benchmark_http(sizes, workdir):
+    """End-to-end timings of /upload and the prediction routes through the Flask test client"""
+    import app as webapp
+    app = webapp.app
+    app.config['ASYNC_UPLOADS'] = False
+    app.config['IMAGE_FOLDER'] = os.path.join(workdir, 'images')
+    app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    webapp.result_cache = ResultCache(os.path.join(workdir, 'cache'))
+    webapp.dataset_store = DatasetStore(os.path.join(workdir, 'datasets'))
+    if webapp.render_pool is not None:
+        webapp.render_pool.warm()
+    client = app.test_client()
+    results = []
+
+    for n_rows in sizes:
+        body = synthetic_customers(n_rows).to_csv(index=False).encode()
+        if len(body) > app.config['MAX_CONTENT_LENGTH']:
+            print(f"  /upload {n_rows} rows skipped: {len(body) / 2**20:.0f} MB exceeds MAX_CONTENT_LENGTH")
+            continue
+        for label in ('upload', 'upload_cached'):
+            start = time.perf_counter()
+            response = client.post('/upload', data={'file': (io.BytesIO(body), 'customers.csv')},
+                                   content_type='multipart/form-data')
+            seconds = time.perf_counter() - start
+            results.append({'route': '/upload', 'case': label, 'rows': n_rows, 'status': response.status_code,
+                            'seconds': round(seconds, 4)})
+            print(f"  /upload {n_rows:>9} rows {label:<14} {seconds:9.3f}s")
+
+    routes = (('/predict_manual', lambda c: client.post('/predict_manual', data={**c, 'model': 'Random Forest'})),
+              ('/api/v1/predict', lambda c: client.post('/api/v1/predict', json={**c, 'model': 'rf'})))
+    for seed, (route, send) in enumerate(routes, start=SEED + 1):
+        # Different customers per route, so no request is answered by the prediction cache
+        customers = synthetic_customers(HTTP_PREDICT_REQUESTS, seed=seed).fillna(0).to_dict('records')
+        latencies = []
+        start = time.perf_counter()
+        for customer in customers:
+            t0 = time.perf_counter()
+            send(customer)
+            latencies.append(time.perf_counter() - t0)
+        seconds = time.perf_counter() - start
+        results.append({'route': route, 'requests': len(customers),
+                        'requests_per_second': round(len(customers) / seconds), **_percentiles(latencies)})
+        print(f"  {route:<16} {len(customers) / seconds:9.0f} req/s  p99 {results[-1]['p99_ms']} ms")
+
+    if webapp.render_pool is not None:
+        webapp.render_pool.shutdown()
+    webapp.job_queue.shutdown()
+    return results
+
+def environment(repeat=DEFAULT_REPEAT):
+    """Versions and hardware the numbers were measured on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'seed': SEED, 'repeat': repeat,
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'sklearn': sklearn.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+def compare(current, previous_path, threshold=REGRESSION_THRESHOLD):
+    """Print every stage against the previous run and return how many slowed down by more than threshold"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    before = {(r['rows'], r['stage']): r['seconds'] for r in previous['stages']}
+    regressions = 0
+    for r in current['stages']:
+        old = before.get((r['rows'], r['stage']))
+        if old and max(old, r['seconds']) >= REGRESSION_MIN_SECONDS:
+            ratio = r['seconds'] / old
+            flag = 'REGRESSION' if ratio > threshold else ''
+            regressions += bool(flag)
+            print(f"  {r['stage']:<16} {r['rows']:>9} rows  {old:9.3f}s -> {r['seconds']:9.3f}s  x{ratio:.2f} {flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the segmentation pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--output', default=None, help='JSON file to write (default: benchmark-<timestamp>.json)')
+    parser.add_argument('--compare', default=None, help='previous results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='slowdown ratio reported as a regression by --compare')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='runs per stage, fastest is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced peak-memory runs')
+    parser.add_argument('--no-http', action='store_true', help='skip the Flask route benchmarks')
+    args = parser.parse_args(argv)
+
+    report = {'environment': environment(args.repeat), 'stages': [], 'http': []}
+    workdir = tempfile.mkdtemp(prefix='segmentation-bench-')
+    try:
+        for n_rows in args.sizes:
+            print(f"{n_rows} rows")
+            report['stages'].extend(benchmark_stages(n_rows, workdir, memory=not args.no_memory, repeat=args.repeat))
+        if not args.no_http:
+            print("HTTP")
+            report['http'] = benchmark_http(args.sizes, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        return 1 if compare(report, args.compare, args.threshold) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
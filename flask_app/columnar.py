@@ -0,0 +1,169 @@
+"""
+Columnar data store for Retail Buyer Segmentation
+Converts customer CSVs to typed Parquet files (categorical strings, downcast
+integers, parsed dates) and loads them back with column projection and
+memory mapping. Falls back to typed CSV parsing when pyarrow is missing.
+
+Usage: python columnar.py <file.csv> [<file.csv> ...]
+"""
+
+import os
+import sys
+import importlib.util
+import pandas as pd
+
+from storage import temp_path
+
+# pyarrow itself is imported where Parquet files are written or read
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+CATEGORICAL_COLS = ['education_level', 'marital_status']
+# Day-first dates, written with either '/' or '-' separators
+DATE_COLS = {'signup_date': '%d/%m/%Y'}
+CONVERT_CHUNK_SIZE = 500000
+
+def parse_dates(values, date_format):
+    """Parse date strings in date_format, accepting '-' as well as '/' separators"""
+    # Dates repeat heavily, so only the distinct strings are parsed
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object).str.replace('-', '/', regex=False),
+                            format=date_format, errors='coerce')
+    return pd.Series(parsed.to_numpy()[codes], index=values.index).where(codes >= 0)
+
+def apply_schema(df):
+    """Return df with categorical strings, parsed dates and downcast integers"""
+    df = df.copy()
+    for col in df.columns:
+        if col in CATEGORICAL_COLS:
+            df[col] = df[col].astype('category')
+        elif col in DATE_COLS:
+            df[col] = parse_dates(df[col], DATE_COLS[col])
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+def parquet_path_for(csv_path):
+    """Sibling .parquet path of a CSV file"""
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+def _arrow_schema(table):
+    """Widen the first chunk's schema so later chunks always fit it"""
+    import pyarrow as pa
+
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        elif pa.types.is_integer(field.type):
+            # Later chunks may hold values outside the first chunk's downcast range
+            field = field.with_type(pa.int64())
+        fields.append(field)
+    # The pandas metadata restores nullable integer columns on load
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+class ChunkWriter:
+    """
+    Write frames chunk by chunk to one Parquet (or, for a .csv path, CSV) file.
+
+    Rows go to a temporary file that replaces path on close(), so readers
+    never see a partial file; leaving the with block on an error discards it.
+    Each writer has its own temporary file, so concurrent writers of the same
+    path never touch each other's rows; the last one to close wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = temp_path(path)
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        """Append a frame; every chunk must have the first chunk's columns"""
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._schema = _arrow_schema(table)
+                self._writer = pq.ParquetWriter(self.tmp_path, self._schema, compression='snappy')
+            self._writer.write_table(table.cast(self._schema))
+        else:
+            df.to_csv(self.tmp_path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self):
+        """Finish the file and move it into place"""
+        self._close_writer()
+        if self.rows == 0:
+            self.abort()
+            raise ValueError('No rows were written')
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Discard everything written so far"""
+        self._close_writer()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def convert_csv(csv_path, parquet_path=None, chunksize=CONVERT_CHUNK_SIZE):
+    """Write a typed Parquet copy of csv_path chunk by chunk and return its path"""
+    if not HAS_PYARROW:
+        raise RuntimeError('pyarrow is required to write Parquet files')
+    parquet_path = parquet_path or parquet_path_for(csv_path)
+    writer = ChunkWriter(parquet_path)
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            writer.write(apply_schema(chunk))
+    except Exception:
+        writer.abort()
+        raise
+    if writer.rows == 0:
+        writer.abort()
+        raise ValueError('The CSV file contains no rows')
+    writer.close()
+    return parquet_path
+
+def read_table(path, columns=None):
+    """Load a Parquet or CSV customer file with only the requested columns"""
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path, columns=columns, memory_map=True)
+        # Integers are stored widened; shrink them again in memory
+        for col in df.select_dtypes('integer').columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        return df
+    usecols = (lambda col: col in columns) if columns is not None else None
+    return apply_schema(pd.read_csv(path, usecols=usecols))
+
+def load_customers(csv_path, columns=None):
+    """
+    Load a customer CSV through its Parquet copy.
+
+    The Parquet file is (re)built when missing or older than the CSV; without
+    pyarrow the CSV is parsed directly with the same typed schema.
+    """
+    if not HAS_PYARROW:
+        return read_table(csv_path, columns)
+    parquet_path = parquet_path_for(csv_path)
+    if not os.path.exists(parquet_path) or os.path.getmtime(parquet_path) < os.path.getmtime(csv_path):
+        convert_csv(csv_path, parquet_path)
+    return read_table(parquet_path, columns)
+
+if __name__ == '__main__':
+    for csv_file in sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data', 'data.csv')]:
+        print(f"Wrote {convert_csv(csv_file)}")
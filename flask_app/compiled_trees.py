@@ -0,0 +1,196 @@
+"""
+Compiled tree ensembles for Retail Buyer Segmentation
+Exports fitted random forest, decision tree and XGBoost pipelines to flat
+NumPy node arrays (the split feature, threshold, children and leaf values of
+every tree, concatenated) and scores a batch of rows with a few vectorized
+steps per tree level. Predictions match the exported pipeline's, but
+scoring imports neither sklearn nor xgboost and skips their per-call
+validation; in a published serving bundle the node arrays are memory-mapped
+and shared by every worker.
+"""
+
+import json
+import numpy as np
+
+CHUNK_ELEMENTS = 1 << 20  # Rows times trees walked at once, bounds the temporary arrays
+
+def _float32_at_most(threshold, strict=False):
+    """float32 thresholds t32 such that x <= t32 (or x < t32 when strict) exactly when x <= threshold, for float32 x"""
+    threshold = np.asarray(threshold, dtype=np.float64)
+    t32 = threshold.astype(np.float32)
+    above = (t32 >= threshold) if strict else (t32 > threshold)
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+class TreeEnsemble:
+    """Flattened tree ensemble with the scaler of its pipeline; a drop-in for the pipeline's predict methods"""
+
+    def __init__(self, feature, threshold, children, default_left, value, roots, depth, classes, link,
+                 scale=None, offset=None):
+        self.feature = feature
+        self.threshold = threshold
+        # Left and right child of node i at 2i and 2i + 1
+        self.children = children
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.classes_ = classes
+        self.link = link
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def from_trees(cls, trees, depth, classes, link, scale=None, offset=None):
+        """
+        Concatenate per-tree node arrays into one ensemble.
+
+        trees is a list of (left, right, feature, threshold, default_left, value)
+        with -1 children at leaves, float32 thresholds compared with <= and one
+        value row per node. Leaves point to themselves, so every row can take
+        depth steps down every tree without checking where it stopped.
+        """
+        parts = list(zip(*trees))
+        sizes = [len(left) for left in parts[0]]
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+
+        left, right = [], []
+        for start, tree_left, tree_right in zip(starts, parts[0], parts[1]):
+            nodes = np.arange(len(tree_left)) + start
+            leaf = np.asarray(tree_left) < 0
+            left.append(np.where(leaf, nodes, np.asarray(tree_left) + start))
+            right.append(np.where(leaf, nodes, np.asarray(tree_right) + start))
+        # Node indexes as intp, which take() uses without converting them first
+        feature = np.concatenate(parts[2]).astype(np.intp)
+        threshold = np.concatenate(parts[3]).astype(np.float32)
+        children = np.column_stack([np.concatenate(left), np.concatenate(right)]).astype(np.intp).ravel()
+        leaves = children[::2] == np.arange(len(feature))
+        feature[leaves] = 0
+        threshold[leaves] = 0
+        return cls(feature, threshold, children, np.concatenate(parts[4]).astype(bool), np.concatenate(parts[5]),
+                   starts, depth, np.asarray(classes), link, scale, offset)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _prepare(self, X):
+        """Scale X as the pipeline's MinMaxScaler would and cast it to the trees' float32"""
+        X = np.array(X, dtype=None if np.asarray(X).dtype in (np.float32, np.float64) else np.float64)
+        if self.scale is not None:
+            X *= self.scale
+            X += self.offset
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def leaves(self, X):
+        """Leaf node reached by every row of a prepared matrix in every tree, shape (rows, trees)"""
+        # Flat indexes into X, which are much cheaper than 2-D fancy indexing
+        row_starts = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        values = X.ravel()
+        missing = np.isnan(values).any()
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            x = values.take(row_starts + self.feature.take(nodes))
+            go_right = ~(x <= self.threshold.take(nodes))
+            if missing:
+                go_right &= ~(np.isnan(x) & self.default_left.take(nodes))
+            nodes = self.children.take(2 * nodes + go_right)
+        return nodes
+
+    def predict_proba(self, X):
+        """Class probabilities of the rows of X, in the order of classes_"""
+        X = self._prepare(X)
+        proba = np.empty((len(X), len(self.classes_)), dtype=np.float32 if self.link != 'mean' else np.float64)
+        step = max(1, CHUNK_ELEMENTS // self.n_trees)
+        for start in range(0, len(X), step):
+            # Summed tree by tree, in the order the original library adds them
+            total = self.value[self.leaves(X[start:start + step])].sum(axis=1)
+            if self.link == 'mean':
+                proba[start:start + step] = total / self.n_trees
+            elif self.link == 'logistic':
+                p = 1 / (1 + np.exp(-total[:, 0]))
+                proba[start:start + step, 0] = 1 - p
+                proba[start:start + step, 1] = p
+            else:
+                e = np.exp(total - total.max(axis=1, keepdims=True))
+                proba[start:start + step] = e / e.sum(axis=1, keepdims=True)
+        return proba
+
+    def predict(self, X):
+        """Class labels of the rows of X"""
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+def _node_depth(left, right):
+    """Depth of the deepest leaf of a tree whose children follow their parents in the node arrays"""
+    depth = np.zeros(len(left), dtype=np.int32)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+def _sklearn_tree(tree):
+    """Node arrays of a fitted sklearn classification tree, with per-leaf class probabilities"""
+    value = tree.value[:, 0, :].astype(np.float64)
+    # Normalized as DecisionTreeClassifier.predict_proba does
+    normalizer = value.sum(axis=1, keepdims=True)
+    normalizer[normalizer == 0] = 1
+    default_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+    return (tree.children_left, tree.children_right, tree.feature, _float32_at_most(tree.threshold),
+            default_left, value / normalizer)
+
+def _xgboost_trees(booster, n_classes):
+    """Node arrays of a fitted XGBoost binary or multi-class booster, preceded by a one-leaf base-margin tree"""
+    model = json.loads(booster.save_raw('json'))['learner']
+    objective = model['objective']['name']
+    base_score = float(model['learner_model_param']['base_score'])
+    groups = 1 if objective.startswith('binary:') else n_classes
+    if objective.startswith('binary:'):
+        base_margin = np.log(base_score / (1 - base_score))
+    elif objective.startswith('multi:'):
+        base_margin = base_score
+    else:
+        raise ValueError(f"Unsupported XGBoost objective {objective}")
+
+    trees = [([-1], [-1], [0], np.zeros(1, dtype=np.float32), [0], np.full((1, groups), base_margin, dtype=np.float32))]
+    gbtree = model['gradient_booster']['model']
+    for tree, group in zip(gbtree['trees'], gbtree['tree_info']):
+        if any(tree['split_type']):
+            raise ValueError("Categorical XGBoost splits are not supported")
+        left = np.asarray(tree['left_children'], dtype=np.int32)
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        # Leaves keep their value in split_conditions
+        value = np.zeros((len(left), groups), dtype=np.float32)
+        value[left < 0, group] = conditions[left < 0]
+        trees.append((left, np.asarray(tree['right_children'], dtype=np.int32), tree['split_indices'],
+                      _float32_at_most(conditions, strict=True), tree['default_left'], value))
+    return trees, ('logistic' if groups == 1 else 'softmax')
+
+def compile_pipeline(pipeline):
+    """TreeEnsemble equivalent of a fitted scaler + tree classifier pipeline, or None for other models"""
+    scaler, model = pipeline.steps[0][1], pipeline.steps[-1][1]
+    kind = type(model).__name__
+    if kind in ('RandomForestClassifier', 'ExtraTreesClassifier', 'DecisionTreeClassifier'):
+        estimators = model.estimators_ if hasattr(model, 'estimators_') else [model]
+        if getattr(model, 'n_outputs_', 1) != 1:
+            return None
+        trees, link = [_sklearn_tree(estimator.tree_) for estimator in estimators], 'mean'
+    elif kind == 'XGBClassifier':
+        trees, link = _xgboost_trees(model.get_booster(), len(model.classes_))
+    else:
+        return None
+
+    depth = max(_node_depth(tree[0], tree[1]) for tree in trees)
+    scale = offset = None
+    if len(pipeline.steps) > 1:
+        if type(scaler).__name__ != 'MinMaxScaler' or scaler.clip:
+            return None
+        scale, offset = scaler.scale_.copy(), scaler.min_.copy()
+    return TreeEnsemble.from_trees(trees, depth, model.classes_, link, scale, offset)
+
+def compile_models(models):
+    """Copy of a {code: pipeline} mapping with every tree ensemble replaced by its TreeEnsemble"""
+    compiled = {}
+    for code, pipeline in models.items():
+        ensemble = compile_pipeline(pipeline)
+        compiled[code] = ensemble if ensemble is not None else pipeline
+    return compiled
@@ -0,0 +1,94 @@
+"""
+Categorical encoding for Retail Buyer Segmentation
+Learns the category-to-code mapping of every string feature (and, for
+selected skewed columns, Yeo-Johnson power-transform parameters) once at
+training time. Scoring then reuses them as vectorized categorical-code
+lookups, so uploads and predictions never refit them; categories unseen at
+training time get the code of the most common training category.
+"""
+
+import numpy as np
+import pandas as pd
+
+# String features turned into numeric codes
+CATEGORICAL_FEATURES = ['education_level', 'marital_status']
+
+# Ordinal features keep this order in their codes; any other categories seen
+# at fit time follow it. Nominal features are coded by descending frequency.
+CATEGORY_ORDER = {
+    'education_level': ['Basic', '2n Cycle', 'Graduation', 'Master', 'PhD'],
+}
+
+# Other spellings of training categories, such as the manual input form's
+CATEGORY_ALIASES = {
+    'education_level': {'Undergraduate': '2n Cycle', 'Graduate': 'Graduation', 'Postgraduate': 'Master'},
+    'marital_status': {'Partner': 'Together'},
+}
+
+class FeatureEncoder:
+    """Fitted categorical codes and optional power transform applied before scaling"""
+
+    def __init__(self, categories, default_codes, power=None, power_features=()):
+        self.categories = categories
+        self.default_codes = default_codes
+        self.power = power
+        self.power_features = list(power_features)
+
+    @classmethod
+    def fit(cls, df, power_features=()):
+        """Learn the codes of the categorical features in df and the power transform of power_features"""
+        categories = {}
+        default_codes = {}
+        for col in CATEGORICAL_FEATURES:
+            if col not in df.columns or pd.api.types.is_numeric_dtype(df[col]):
+                continue
+            counts = df[col].astype(object).value_counts()
+            if col in CATEGORY_ORDER:
+                levels = CATEGORY_ORDER[col] + sorted(c for c in counts.index if c not in CATEGORY_ORDER[col])
+            else:
+                levels = list(counts.index)
+            categories[col] = levels
+            # Unseen values get the code of the most common training category
+            default_codes[col] = levels.index(counts.index[0]) if len(counts) else 0
+
+        power = None
+        power_features = [col for col in power_features if col in df.columns]
+        if power_features:
+            from sklearn.preprocessing import PowerTransformer
+
+            power = PowerTransformer(method='yeo-johnson', standardize=False)
+            power.fit(df[power_features].to_numpy(dtype=np.float64))
+        return cls(categories, default_codes, power, power_features)
+
+    def code(self, col, value):
+        """Code of a single category value; numbers are taken as codes already"""
+        if isinstance(value, (int, float, np.number)) and not pd.isna(value):
+            return float(value)
+        value = CATEGORY_ALIASES.get(col, {}).get(value, value)
+        levels = self.categories[col]
+        return float(levels.index(value) if value in levels else self.default_codes[col])
+
+    def codes(self, col, values):
+        """Float codes of a Series of category values"""
+        if pd.api.types.is_numeric_dtype(values):
+            return values.to_numpy(dtype=np.float32)
+        # Only the distinct values are looked up; rows take their code by
+        # index, missing ones (-1) the default in the last slot
+        codes, uniques = pd.factorize(values)
+        lookup = np.array([self.code(col, value) for value in uniques] + [self.default_codes[col]], dtype=np.float32)
+        return lookup[codes]
+
+    def encode(self, df):
+        """Return df with the categorical features replaced by their codes"""
+        return df.assign(**{col: self.codes(col, df[col]) for col in self.categories if col in df.columns})
+
+    def transform(self, df, features):
+        """float32 matrix of features from a preprocessed frame, encoded and power-transformed"""
+        # Column-major, so every feature is written as one contiguous block
+        X = np.empty((len(df), len(features)), dtype=np.float32, order='F')
+        for i, col in enumerate(features):
+            X[:, i] = self.codes(col, df[col]) if col in self.categories else df[col].to_numpy(dtype=np.float32)
+        if self.power is not None:
+            index = [features.index(col) for col in self.power_features]
+            X[:, index] = self.power.transform(X[:, index].astype(np.float64))
+        return X
@@ -0,0 +1,224 @@
+"""
+Data explorer for Retail Buyer Segmentation
+Keeps segmented upload results server-side as compact columnar files and
+serves them a page at a time, sorted and filtered by cluster, income range
+and top spending category, so the browser never receives the full dataset.
+Each dataset can also keep the similar-customer index of its rows.
+"""
+
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+
+from segmentation import SPEND_COLS
+from columnar import HAS_PYARROW, ChunkWriter, read_table
+from storage import BoundedDirectory
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATASET_DIR = os.path.join(BASE_DIR, 'cache', 'datasets')
+DATASET_MAX_ENTRIES = 200
+DATASET_MEMORY_ENTRIES = 8  # Datasets (with their sort orders) and indexes kept loaded
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+DATASET_EXT = '.parquet' if HAS_PYARROW else '.csv'
+
+# Columns kept for browsing and their in-memory types
+EXPLORER_COLUMNS = {
+    'customer_id': 'Int64',  # Nullable: uploads may have customers without an ID
+    'cluster': 'int16',
+    'age': 'float32',
+    'education_level': 'category',
+    'marital_status': 'category',
+    'family_size': 'float32',
+    'annual_income': 'float32',
+    'total_spent': 'float32',
+    'total_purchases': 'float32',
+    'top_category': 'category',
+    'days_since_last_purchase': 'float32',
+}
+
+# Display names of the spend columns, used for the top-category filter
+SPEND_CATEGORIES = {col: col[len('spend_'):].capitalize() for col in SPEND_COLS}
+
+def explorer_frame(df):
+    """Compact copy of a segmented frame with the explorer columns"""
+    spend_cols = [col for col in SPEND_COLS if col in df.columns]
+    if spend_cols:
+        spend = np.nan_to_num(df[spend_cols].to_numpy(dtype=np.float32))
+        names = np.array([SPEND_CATEGORIES[col] for col in spend_cols], dtype=object)
+        # Customers who spent nothing have no top category
+        df = df.assign(top_category=np.where(spend.max(axis=1) > 0, names[spend.argmax(axis=1)], None))
+    out = {}
+    for col, dtype in EXPLORER_COLUMNS.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'category':
+            out[col] = df[col].astype(object).astype('category')
+        elif dtype.startswith('int') and df[col].isna().any():
+            out[col] = df[col].astype('float64')
+        else:
+            out[col] = df[col].astype(dtype)
+    return pd.DataFrame(out)
+
+class Dataset:
+    """A loaded dataset with its cached sort orders and filter choices"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._orders = {}
+        self._lock = threading.Lock()
+        self.clusters = sorted(int(c) for c in frame['cluster'].unique()) if 'cluster' in frame.columns else []
+        self.categories = ([c for c in SPEND_CATEGORIES.values() if c in set(frame['top_category'].dropna())]
+                           if 'top_category' in frame.columns else [])
+
+    def _sort_key(self, column):
+        values = self.frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Alphabetical order, missing values as NaN
+            codes = values.cat.reorder_categories(sorted(values.cat.categories)).cat.codes.to_numpy()
+            return np.where(codes >= 0, codes, np.nan)
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def order(self, column, descending=False):
+        """Row order sorted by column with missing values last, computed once per column and direction"""
+        key = (column, descending)
+        with self._lock:
+            order = self._orders.get(key)
+        if order is None:
+            values = self._sort_key(column)
+            order = np.argsort(-values if descending else values, kind='stable')
+            with self._lock:
+                self._orders[key] = order
+        return order
+
+class DatasetStore(BoundedDirectory):
+    """Segmented results by ID on disk, with the most recently browsed ones kept in memory"""
+
+    entry_ext = DATASET_EXT
+
+    def __init__(self, dataset_dir=DEFAULT_DATASET_DIR, max_entries=DATASET_MAX_ENTRIES,
+                 memory_entries=DATASET_MEMORY_ENTRIES):
+        super().__init__(dataset_dir, max_entries, memory_entries)
+
+    def path(self, dataset_id):
+        return self.entry_path(dataset_id)
+
+    def index_path(self, dataset_id):
+        return os.path.join(self.directory, f'{dataset_id}.index.pkl')
+
+    def entry_files(self, dataset_id):
+        return [self.path(dataset_id), self.index_path(dataset_id)]
+
+    def memory_keys(self, dataset_id):
+        return [dataset_id, (dataset_id, 'index')]
+
+    def exists(self, dataset_id):
+        """Whether a dataset is still stored"""
+        return dataset_id is not None and os.path.exists(self.path(dataset_id))
+
+    def save(self, dataset_id, df):
+        """Store the explorer columns of a segmented frame under dataset_id"""
+        if self.exists(dataset_id):
+            # IDs are content keys, so another upload of the same file already stored these rows
+            try:
+                os.utime(self.path(dataset_id))
+                return
+            except FileNotFoundError:
+                pass
+        with self.writer(dataset_id) as writer:
+            writer.write(explorer_frame(df))
+        self.evict()
+
+    def save_index(self, dataset_id, index):
+        """Store the SimilarityIndex of a dataset next to it"""
+        index.save(self.index_path(dataset_id))
+
+    def load_index(self, dataset_id):
+        """Return the SimilarityIndex of a stored dataset, or None"""
+        if not dataset_id.isalnum():
+            return None
+        key = (dataset_id, 'index')
+        index = self._recall(key)
+        if index is not None:
+            return index
+        try:
+            with open(self.index_path(dataset_id), 'rb') as f:
+                index = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        self._remember(key, index)
+        return index
+
+    def writer(self, dataset_id):
+        """ChunkWriter for a dataset built chunk by chunk; pass frames through explorer_frame first"""
+        return ChunkWriter(self.path(dataset_id))
+
+    def load(self, dataset_id):
+        """Return the Dataset stored under dataset_id, or None"""
+        if not dataset_id.isalnum():
+            return None
+        dataset = self._recall(dataset_id)
+        if dataset is not None:
+            return dataset
+        path = self.path(dataset_id)
+        try:
+            frame = read_table(path)
+            # Browsing refreshes the modification time used as the LRU clock
+            os.utime(path)
+        except (FileNotFoundError, OSError):
+            return None
+        dataset = Dataset(frame)
+        self._remember(dataset_id, dataset)
+        return dataset
+
+def json_rows(frame, rows):
+    """The given rows of a frame as lists of plain Python values, missing ones as null and floats rounded"""
+    selected = frame.iloc[rows]
+    floats = selected.select_dtypes('floating').columns
+    selected = selected.astype({col: 'float64' for col in floats}).round(2).astype(object)
+    return selected.where(selected.notna(), None).values.tolist()
+
+def query(dataset, page=1, per_page=DEFAULT_PAGE_SIZE, sort=None, descending=False, cluster=None,
+          min_income=None, max_income=None, category=None):
+    """
+    Return one page of a Dataset as a JSON-ready dict.
+
+    Filters combine with AND; rows with a missing income never match an
+    income bound. Raises ValueError for an unknown sort column.
+    """
+    frame = dataset.frame
+    if sort is not None and sort not in frame.columns:
+        raise ValueError(f'Unknown sort column: {sort}')
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+    page = max(page, 1)
+
+    mask = np.ones(len(frame), dtype=bool)
+    if cluster is not None and 'cluster' in frame.columns:
+        mask &= frame['cluster'].to_numpy() == cluster
+    if min_income is not None and 'annual_income' in frame.columns:
+        mask &= frame['annual_income'].to_numpy() >= min_income
+    if max_income is not None and 'annual_income' in frame.columns:
+        mask &= frame['annual_income'].to_numpy() <= max_income
+    if category is not None and 'top_category' in frame.columns:
+        mask &= (frame['top_category'] == category).to_numpy()
+
+    if sort is None:
+        rows = np.flatnonzero(mask)
+    else:
+        order = dataset.order(sort, descending)
+        rows = order[mask[order]]
+    total = len(rows)
+    pages = max((total + per_page - 1) // per_page, 1)
+    page = min(page, pages)
+    return {
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': pages,
+        'columns': list(frame.columns),
+        'rows': json_rows(frame, rows[(page - 1) * per_page:page * per_page]),
+        'clusters': dataset.clusters,
+        'categories': dataset.categories,
+    }
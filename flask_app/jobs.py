@@ -0,0 +1,224 @@
+"""
+Background job queue for Retail Buyer Segmentation
+Runs CSV upload processing on a local process pool and records per-stage
+progress in a SQLite job table, so web workers return immediately.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from segmentation import preprocess_data, perform_clustering
+from visualizations import generate_visualizations
+from columnar import read_table
+from metrics import metrics
+from similarity import index_segmented
+
+STAGES = ['parse', 'preprocess', 'cluster', 'visualize']
+
+def process_upload(filepath, image_dir, report=None, render_pool=None, segmenter=None, cache=None, cache_key=None,
+                   datasets=None):
+    """
+    Run the upload pipeline on a saved CSV, calling report(stage) as each stage starts.
+
+    With a frozen SegmentationModel as segmenter, customers are assigned to its
+    segments; otherwise (or when the file lacks its features) K-Means is fitted
+    on the upload itself. With a ResultCache the result is stored under cache_key.
+    With a DatasetStore the segmented rows are kept there for the data explorer,
+    under cache_key when given, along with a similar-customer index when they
+    were assigned to the frozen segments and carry customer IDs.
+    """
+    report = report or (lambda stage: None)
+
+    report('parse')
+    with metrics.stage('upload', 'parse') as sample:
+        # The upload is parsed once with the typed schema; the segmented rows
+        # are kept by the DatasetStore, so the CSV itself is not needed again
+        df = read_table(filepath)
+        os.remove(filepath)
+        sample['rows'] = len(df)
+
+    report('preprocess')
+    with metrics.stage('upload', 'preprocess', rows=len(df)):
+        df = preprocess_data(df, segmenter.fill_values if segmenter is not None else None)
+
+    report('cluster')
+    X = None
+    with metrics.stage('upload', 'cluster', rows=len(df)):
+        if segmenter is not None and not segmenter.missing_features(df):
+            # The scaled matrix is kept for the similar-customer index
+            X = segmenter.transform(df)
+            clusters, _ = segmenter.nearest(X)
+        else:
+            clusters, _ = perform_clustering(df)
+    if clusters is not None:
+        df['cluster'] = clusters
+
+    # Generate statistics
+    stats = {
+        'total_customers': len(df),
+        'avg_income': f"${df['annual_income'].mean():.2f}" if 'annual_income' in df.columns else 'N/A',
+        'avg_age': f"{df['age'].mean():.1f}" if 'age' in df.columns else 'N/A',
+        'total_revenue': f"${df['total_spent'].sum():.2f}" if 'total_spent' in df.columns else 'N/A',
+        'avg_spending': f"${df['total_spent'].mean():.2f}" if 'total_spent' in df.columns else 'N/A',
+    }
+
+    if clusters is not None:
+        stats['num_segments'] = len(np.unique(clusters))
+
+    report('visualize')
+    with metrics.stage('upload', 'visualize', rows=len(df)):
+        plots = generate_visualizations(df, clusters, image_dir, render_pool=render_pool)
+
+    result = {'stats': stats, 'plots': plots, 'dataset_id': None}
+    if datasets is not None:
+        # The rows themselves are browsed page by page through the data explorer
+        result['dataset_id'] = cache_key or uuid.uuid4().hex
+        with metrics.stage('upload', 'store', rows=len(df)):
+            datasets.save(result['dataset_id'], df)
+        if X is not None and 'customer_id' in df.columns:
+            with metrics.stage('upload', 'index', rows=len(df)):
+                datasets.save_index(result['dataset_id'], index_segmented(segmenter, df, X, clusters))
+    if cache is not None:
+        cache.put(cache_key, result)
+    return result
+
+class JobStore:
+    """SQLite-backed table of upload jobs shared by web and worker processes"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    stages TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, filename):
+        """Insert a queued job and return its ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        stages = json.dumps({stage: 'pending' for stage in STAGES})
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, filename, status, stages, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, filename, 'queued', stages, now, now))
+        return job_id
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['stages'] = json.loads(job['stages'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['progress'] = sum(state == 'done' for state in job['stages'].values()) / len(STAGES)
+        return job
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def start_stage(self, job_id, stage):
+        """Mark stage as running and every earlier stage as done"""
+        index = STAGES.index(stage)
+        stages = {name: 'done' if i < index else 'running' if i == index else 'pending'
+                  for i, name in enumerate(STAGES)}
+        self._update(job_id, status='running', stage=stage, stages=json.dumps(stages))
+
+    def finish(self, job_id, result):
+        """Store the result of a completed job"""
+        stages = json.dumps({stage: 'done' for stage in STAGES})
+        self._update(job_id, status='done', stage=None, stages=stages, result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        """Record why a job failed, keeping the stage it failed in"""
+        job = self.get(job_id)
+        stages = job['stages'] if job else {}
+        if job and job['stage']:
+            stages[job['stage']] = 'failed'
+        self._update(job_id, status='failed', stages=json.dumps(stages), error=error)
+
+def run_upload_job(db_path, job_id, filepath, image_dir, segmenter=None, cache=None, cache_key=None, datasets=None):
+    """Worker entry point: process one uploaded file, record the outcome and return its metric samples"""
+    metrics.collecting = True
+    store = JobStore(db_path)
+    try:
+        # Charts are rendered in the job worker itself: the workers already
+        # run in parallel, so a render pool per worker would only add processes
+        result = process_upload(filepath, image_dir, report=lambda stage: store.start_stage(job_id, stage),
+                                segmenter=segmenter, cache=cache, cache_key=cache_key, datasets=datasets)
+        store.finish(job_id, result)
+    except Exception as e:
+        store.fail(job_id, str(e))
+    return metrics.drain()
+
+class JobQueue:
+    """Submits upload jobs to a lazily started local process pool"""
+
+    def __init__(self, db_path, max_workers=None):
+        self.store = JobStore(db_path)
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers avoid forking a multi-threaded web server
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, filepath, filename, image_dir, segmenter=None, cache=None, cache_key=None, datasets=None):
+        """Queue an uploaded file for processing and return the job ID"""
+        job_id = self.store.create(filename)
+        future = self._get_executor().submit(run_upload_job, self.store.db_path, job_id, filepath, image_dir,
+                                             segmenter, cache, cache_key, datasets)
+
+        def _on_done(f):
+            # Covers crashes of the worker process itself
+            if f.exception() is not None:
+                self.store.fail(job_id, str(f.exception()))
+            else:
+                metrics.merge(f.result())
+
+        future.add_done_callback(_on_done)
+        return job_id
+
+    def complete(self, filename, result):
+        """Record an already computed result as a finished job and return its ID"""
+        job_id = self.store.create(filename)
+        self.store.finish(job_id, result)
+        return job_id
+
+    def shutdown(self):
+        """Stop the process pool, waiting for running jobs"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,131 @@
+"""
+Instrumentation for Retail Buyer Segmentation
+Records per-stage latency histograms, rows processed and peak allocation for
+the upload, prediction and visualization pipelines, and renders them in the
+Prometheus text exposition format.
+
+Samples recorded in job worker processes are drained there and merged into
+the web process when the job finishes, so /metrics covers both.
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(2 ** p for p in range(20, 33, 2))  # 1 MiB to 4 GiB
+
+# Peak allocation per stage needs tracemalloc, which slows allocation-heavy
+# code down; enable it with SEGMENTATION_TRACE_MEMORY=1
+TRACE_MEMORY = os.environ.get('SEGMENTATION_TRACE_MEMORY') == '1'
+
+class Histogram:
+    """Cumulative bucket counts with a sum, as exposed by Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+class Metrics:
+    """Process-local registry of stage samples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._peak = {}
+        self._rows = {}
+        self._pending = []
+        self.collecting = False
+        if TRACE_MEMORY and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(self, pipeline, stage, seconds, rows=0, peak_bytes=None):
+        """Add one stage sample"""
+        key = (pipeline, stage)
+        with self._lock:
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self._rows[key] = self._rows.get(key, 0) + rows
+            if peak_bytes is not None:
+                self._peak.setdefault(key, Histogram(BYTES_BUCKETS)).observe(peak_bytes)
+            if self.collecting:
+                self._pending.append((pipeline, stage, seconds, rows, peak_bytes))
+
+    @contextmanager
+    def stage(self, pipeline, stage, rows=0):
+        """
+        Time the enclosed block as one stage sample.
+
+        Yields a dict whose 'rows' entry can be set once the row count is known.
+        Nested stages share tracemalloc's peak, so an outer stage only sees the
+        peak reached after its last inner stage started.
+        """
+        sample = {'rows': rows}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = tracemalloc.get_traced_memory()[1] - baseline if tracemalloc.is_tracing() else None
+            self.record(pipeline, stage, seconds, sample['rows'], peak_bytes)
+
+    def drain(self):
+        """Return and forget the samples recorded since the last drain while collecting, for merging elsewhere"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def merge(self, samples):
+        """Record samples drained in another process"""
+        for sample in samples:
+            self.record(*sample)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP segmentation_stage_seconds Latency of a pipeline stage.')
+            lines.append('# TYPE segmentation_stage_seconds histogram')
+            for (pipeline, stage), histogram in sorted(self._latency.items()):
+                lines.extend(histogram.lines('segmentation_stage_seconds', f'pipeline="{pipeline}",stage="{stage}"'))
+            lines.append('# HELP segmentation_stage_rows_total Rows processed by a pipeline stage.')
+            lines.append('# TYPE segmentation_stage_rows_total counter')
+            for (pipeline, stage), rows in sorted(self._rows.items()):
+                lines.append(f'segmentation_stage_rows_total{{pipeline="{pipeline}",stage="{stage}"}} {rows}')
+            if self._peak:
+                lines.append('# HELP segmentation_stage_peak_bytes Peak traced allocation during a pipeline stage.')
+                lines.append('# TYPE segmentation_stage_peak_bytes histogram')
+                for (pipeline, stage), histogram in sorted(self._peak.items()):
+                    lines.extend(histogram.lines('segmentation_stage_peak_bytes', f'pipeline="{pipeline}",stage="{stage}"'))
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            lines.append('# HELP process_max_resident_memory_bytes Peak resident set size of the web process.')
+            lines.append('# TYPE process_max_resident_memory_bytes gauge')
+            lines.append(f'process_max_resident_memory_bytes {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}')
+        return '\n'.join(lines) + '\n'
+
+# Shared by every module in this process
+metrics = Metrics()
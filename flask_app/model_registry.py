@@ -0,0 +1,125 @@
+"""
+Model registry for Retail Buyer Segmentation
+Trains every classifier offered on the manual input page once against the
+K-Means segments of the reference dataset, persists the fitted pipelines to
+a versioned artifact and keeps them in memory for per-request predictions.
+"""
+
+import os
+import hashlib
+import pickle
+import importlib
+import threading
+import numpy as np
+import pandas as pd
+
+from segmentation_model import SegmentationModel, DEFAULT_MODEL_DIR
+from storage import atomic_pickle
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_PATH = os.path.join(BASE_DIR, '..', 'Data', 'data.csv')
+
+# Bump whenever training code changes in a way that invalidates saved artifacts
+REGISTRY_VERSION = 4
+
+def _estimator(module, name, **params):
+    """Factory for an estimator whose library is only imported when it is built"""
+    return lambda: getattr(importlib.import_module(module), name)(**params)
+
+# Estimator factories keyed by the codes used in AVAILABLE_MODELS
+MODEL_BUILDERS = {
+    'rf': _estimator('sklearn.ensemble', 'RandomForestClassifier', n_estimators=100, random_state=0),
+    'xgb': _estimator('xgboost', 'XGBClassifier', n_estimators=100, random_state=0, n_jobs=1, eval_metric='logloss'),
+    'lr': _estimator('sklearn.linear_model', 'LogisticRegression', max_iter=1000),
+    'dt': _estimator('sklearn.tree', 'DecisionTreeClassifier', random_state=0),
+    'knn': _estimator('sklearn.neighbors', 'KNeighborsClassifier', n_neighbors=5),
+    'nb': _estimator('sklearn.naive_bayes', 'GaussianNB'),
+}
+
+def build_pipeline(code):
+    """Unfitted scaler + classifier pipeline for a model code"""
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import MinMaxScaler
+
+    return Pipeline([('scaler', MinMaxScaler()), ('model', MODEL_BUILDERS[code]())])
+
+def _fingerprint(data_path):
+    """Hash the training data and library versions that determine an artifact"""
+    import sklearn
+
+    digest = hashlib.sha256()
+    with open(data_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(f'{REGISTRY_VERSION}|{sklearn.__version__}|{",".join(sorted(MODEL_BUILDERS))}'.encode())
+    return digest.hexdigest()[:16]
+
+# Per-thread single-row feature buffers reused across predictions
+_row_buffers = threading.local()
+
+class ModelRegistry:
+    """In-memory collection of fitted classifier pipelines sharing one feature layout"""
+
+    def __init__(self, models, features, segmenter, version):
+        self.models = models
+        self.features = features
+        self.segmenter = segmenter
+        self.version = version
+
+    @classmethod
+    def train(cls, data_path=DEFAULT_DATA_PATH, version=None):
+        """Fit every classifier on the K-Means labels of the reference dataset"""
+        raw = pd.read_csv(data_path)
+        segmenter = SegmentationModel.fit(raw)
+        df, (clusters, _) = segmenter.predict(raw)
+        features = segmenter.features
+
+        X = segmenter.feature_matrix(df)
+        models = {}
+        for code in MODEL_BUILDERS:
+            pipeline = build_pipeline(code)
+            pipeline.fit(X, clusters)
+            models[code] = pipeline
+        return cls(models, features, segmenter, version or _fingerprint(data_path))
+
+    def save(self, model_dir=DEFAULT_MODEL_DIR):
+        """Write the registry to a versioned artifact and return its path"""
+        os.makedirs(model_dir, exist_ok=True)
+        path = os.path.join(model_dir, f'registry-{self.version}.pkl')
+        atomic_pickle(self, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Load a registry artifact from disk"""
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    @classmethod
+    def load_or_train(cls, data_path=DEFAULT_DATA_PATH, model_dir=DEFAULT_MODEL_DIR):
+        """Load the artifact matching the current data and code, training it on a miss"""
+        version = _fingerprint(data_path)
+        path = os.path.join(model_dir, f'registry-{version}.pkl')
+        if os.path.exists(path):
+            return cls.load(path)
+        registry = cls.train(data_path, version=version)
+        registry.save(model_dir)
+        return registry
+
+    def compiled(self):
+        """Copy of the registry with its tree ensembles exported to NumPy evaluators (see compiled_trees)"""
+        from compiled_trees import compile_models
+
+        return ModelRegistry(compile_models(self.models), self.features, self.segmenter, self.version)
+
+    def feature_vector(self, values):
+        """Fill this thread's preallocated single-row feature matrix from a mapping of feature values"""
+        row = getattr(_row_buffers, 'row', None)
+        if row is None or row.shape[1] != len(self.features):
+            row = _row_buffers.row = np.empty((1, len(self.features)))
+        row[0] = [values.get(col, 0) for col in self.features]
+        return row
+
+    def predict(self, model_code, values):
+        """Predict the segment of one customer with the given model"""
+        return int(self.models[model_code].predict(self.feature_vector(values))[0])
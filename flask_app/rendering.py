@@ -0,0 +1,104 @@
+"""
+Parallel chart rendering for Retail Buyer Segmentation
+Farms independent matplotlib figures out to a warm process pool whose
+workers import matplotlib once at startup, so a page waits for its slowest
+chart instead of the sum of all of them.
+
+Render functions must be importable module-level callables that take one
+data argument and return a matplotlib Figure.
+"""
+
+import io
+import os
+import importlib
+import threading
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from storage import temp_path
+
+DEFAULT_PRELOAD = ('matplotlib.figure', 'matplotlib.backends.backend_agg', 'pandas')
+
+def _init_worker(preload):
+    """Import the plotting stack once per worker process"""
+    import matplotlib
+    matplotlib.use('Agg')
+    for module in preload:
+        importlib.import_module(module)
+
+def _ping():
+    return os.getpid()
+
+def render_png(render, data, **savefig_kwargs):
+    """Render a figure and return it as PNG bytes"""
+    fig = render(data)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', **savefig_kwargs)
+    return buffer.getvalue()
+
+def render_to_file(render, data, path, **savefig_kwargs):
+    """Render a figure and atomically write it to path"""
+    fig = render(data)
+    tmp_path = temp_path(path)
+    fig.savefig(tmp_path, format='png', **savefig_kwargs)
+    os.replace(tmp_path, path)
+    return path
+
+class RenderPool:
+    """Lazily started process pool dedicated to figure rendering"""
+
+    def __init__(self, max_workers=None, preload=DEFAULT_PRELOAD):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.preload = tuple(preload)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.preload,))
+                # Multiprocessing joins child processes at exit before executors shut
+                # down, which deadlocks when this pool lives inside a worker process; the
+                # priority puts this ahead of the finalizers that close the call queue
+                multiprocessing.util.Finalize(self, self.shutdown, exitpriority=100)
+            return self._executor
+
+    def warm(self):
+        """Start every worker now so the first page doesn't pay the import cost"""
+        executor = self._get_executor()
+        wait([executor.submit(_ping) for _ in range(self.max_workers)])
+
+    def warm_in_background(self):
+        """Warm the pool from a daemon thread"""
+        threading.Thread(target=self.warm, name='render-pool-warmup', daemon=True).start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a render worker and return its future"""
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def render_many(self, jobs, **savefig_kwargs):
+        """Render (render, data) pairs in parallel and return PNG bytes in order"""
+        futures = [self.submit(render_png, render, data, **savefig_kwargs) for render, data in jobs]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_render_pool(max_workers=None, preload=DEFAULT_PRELOAD):
+    """Return the process-wide render pool for this configuration"""
+    key = (max_workers, tuple(preload))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = RenderPool(max_workers, preload)
+        return _pools[key]
@@ -0,0 +1,109 @@
+"""
+Result caches for Retail Buyer Segmentation
+Keeps processed upload results keyed by the SHA-256 of the uploaded bytes and
+the model/config versions they were computed with, in a bounded in-memory LRU
+backed by a size-bounded LRU directory on disk, plus an in-memory LRU of
+single-customer predictions keyed on the feature vector.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from visualizations import PLOT_VERSION
+from storage import atomic_write, BoundedDirectory
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'results')
+RESULT_CACHE_MAX_ENTRIES = 200
+RESULT_CACHE_MEMORY_ENTRIES = 32
+PREDICTION_CACHE_SIZE = 10000
+
+# Bump whenever the upload pipeline changes what it computes
+RESULT_CACHE_VERSION = 3
+
+def file_sha256(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ResultCache(BoundedDirectory):
+    """Upload results by content hash, in memory and in an LRU-evicted directory"""
+
+    entry_ext = '.json'
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 memory_entries=RESULT_CACHE_MEMORY_ENTRIES):
+        super().__init__(cache_dir, max_entries, memory_entries)
+
+    @staticmethod
+    def key(content_digest, *versions):
+        """Cache key of an upload's contents processed under the given model/config versions"""
+        parts = [content_digest, str(RESULT_CACHE_VERSION), str(PLOT_VERSION), *map(str, versions)]
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def entry_files(self, key):
+        # .npy cluster files were written alongside by earlier versions
+        return [self.entry_path(key), os.path.join(self.directory, f'{key}.npy')]
+
+    def get(self, key, image_dir=None):
+        """
+        Return the cached result for key, or None.
+
+        With image_dir, entries whose plot images have since been evicted from
+        the plot cache count as misses.
+        """
+        result = self._recall(key)
+        path = self.entry_path(key)
+        if result is None:
+            try:
+                with open(path) as f:
+                    result = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return None
+            self._remember(key, result)
+        if image_dir and not all(os.path.exists(os.path.join(image_dir, plot)) for plot in result['plots']):
+            return None
+        try:
+            # A hit refreshes the modification time used as the LRU clock
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """Store an upload's result; its segmented rows are kept by the DatasetStore"""
+        with atomic_write(self.entry_path(key), 'w') as f:
+            json.dump(result, f)
+        self._remember(key, result)
+        self.evict()
+
+class PredictionCache:
+    """LRU of single-customer predictions in front of a predictor with a predict(model_code, values) method"""
+
+    def __init__(self, predictor, features, version, maxsize=PREDICTION_CACHE_SIZE):
+        self.predictor = predictor
+        self.features = features
+        self.version = version
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def predict(self, model_code, values):
+        """Predict the segment of one customer, reusing the answer for an identical feature vector"""
+        key = (model_code, self.version, tuple(float(values.get(col, 0)) for col in self.features))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        prediction = self.predictor.predict(model_code, values)
+        with self._lock:
+            self._entries[key] = prediction
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return prediction
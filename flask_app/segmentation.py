@@ -0,0 +1,221 @@
+"""
+Data processing layer for Retail Buyer Segmentation
+Feature engineering, preprocessing and K-Means clustering shared by the
+Flask routes and the model registry. scikit-learn is imported on first use,
+so the web process can start without it.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_datetime64_any_dtype
+
+from columnar import DATE_COLS, parse_dates
+from encoding import CATEGORICAL_FEATURES, FeatureEncoder
+
+SPEND_COLS = ['spend_wine', 'spend_fruits', 'spend_meat', 'spend_fish', 'spend_sweets', 'spend_gold']
+PURCHASE_COLS = ['num_discount_purchases', 'num_web_purchases', 'num_catalog_purchases', 'num_store_purchases']
+CAMPAIGN_COLS = ['accepted_campaign_1', 'accepted_campaign_2', 'accepted_campaign_3', 'accepted_campaign_4', 'accepted_campaign_5']
+# Marital statuses counted as a two-adult household in family_size
+# ('Partner' is the manual input form's value)
+PARTNER_STATUSES = ['Married', 'Together', 'Partner']
+# Identifier columns, never imputed: a filled-in ID would name another customer
+ID_COLS = ['customer_id']
+
+# Raw fields of a single customer and their defaults when omitted
+CUSTOMER_FIELDS = {
+    'annual_income': 0, 'num_children': 0, 'num_teenagers': 0,
+    'days_since_last_purchase': 30, 'spend_wine': 0, 'spend_fruits': 0, 'spend_meat': 0,
+    'spend_fish': 0, 'spend_sweets': 0, 'spend_gold': 0, 'num_discount_purchases': 0,
+    'num_web_purchases': 0, 'num_catalog_purchases': 0, 'num_store_purchases': 0,
+    'web_visits_last_month': 0, 'total_accepted_campaigns': 0, 'age': 0, 'signup_year': 2013
+}
+CUSTOMER_CATEGORIES = {'education_level': 'Graduation', 'marital_status': 'Single'}
+
+# Clustering engine settings
+MINIBATCH_THRESHOLD = 100000
+MINIBATCH_SIZE = 4096
+K_CANDIDATES = range(2, 9)
+K_SELECTION_FIT_SIZE = 100000
+SILHOUETTE_SAMPLE_SIZE = 5000
+# Skewed features power-transformed before scaling
+POWER_FEATURES = []
+
+# All 24 candidate features for clustering (the notebook's 23 plus marital_status)
+CLUSTERING_FEATURES = [
+    'education_level', 'marital_status', 'annual_income', 'num_children', 'num_teenagers',
+    'days_since_last_purchase', 'spend_wine', 'spend_fruits', 'spend_meat',
+    'spend_fish', 'spend_sweets', 'spend_gold', 'num_discount_purchases',
+    'num_web_purchases', 'num_catalog_purchases', 'num_store_purchases',
+    'web_visits_last_month', 'total_accepted_campaigns', 'age',
+    'signup_year', 'total_spent', 'total_purchases', 'children', 'family_size'
+]
+
+def fit_imputation(df):
+    """Return the fill value of every column but the IDs: medians for numeric columns, modes otherwise"""
+    df = df.drop(columns=ID_COLS, errors='ignore')
+    numeric = df.select_dtypes(include=[np.number])
+    categorical = df.select_dtypes(include=['object', 'category'])
+    medians = numeric.median()
+    modes = categorical.mode(dropna=True).head(1).reindex([0]).iloc[0] if not categorical.empty else pd.Series(dtype=object)
+    return pd.concat([medians, modes.astype(object).fillna('Unknown')])
+
+def impute_missing(df, fill_values):
+    """Return a copy of df with missing values replaced in bulk from fill_values; IDs stay missing"""
+    # Models fitted by earlier versions still carry a median customer_id
+    fill_values = fill_values[fill_values.index.isin(df.columns[df.isna().any()]) & ~fill_values.index.isin(ID_COLS)]
+    if fill_values.empty:
+        return df.copy()
+    for col in df.columns[df.dtypes == 'category'].intersection(fill_values.index):
+        # Categorical columns only accept fill values among their categories
+        if fill_values[col] not in df[col].cat.categories:
+            df = df.assign(**{col: df[col].cat.add_categories(fill_values[col])})
+    return df.fillna(fill_values.to_dict())
+
+def engineer_features(df):
+    """Return the derived feature columns that can be computed from df"""
+    features = {}
+    features['age'] = 2014 - df['birth_year'] if 'birth_year' in df.columns else df.get('age', 0)
+    if all(col in df.columns for col in SPEND_COLS):
+        features['total_spent'] = df[SPEND_COLS].sum(axis=1)
+    if all(col in df.columns for col in PURCHASE_COLS):
+        features['total_purchases'] = df[PURCHASE_COLS].sum(axis=1)
+    if all(col in df.columns for col in CAMPAIGN_COLS):
+        features['total_accepted_campaigns'] = df[CAMPAIGN_COLS].sum(axis=1)
+    if 'signup_date' in df.columns:
+        signup_date = df['signup_date']
+        if not is_datetime64_any_dtype(signup_date):
+            signup_date = parse_dates(signup_date, DATE_COLS['signup_date'])
+        features['signup_year'] = signup_date.dt.year
+    if 'num_children' in df.columns and 'num_teenagers' in df.columns:
+        features['children'] = df['num_children'] + df['num_teenagers']
+        if 'marital_status' in df.columns:
+            features['family_size'] = features['children'] + np.where(df['marital_status'].isin(PARTNER_STATUSES), 2, 1)
+    return features
+
+def customer_features(values, encoder=None):
+    """
+    Assemble the features of one customer from form or JSON fields without building a DataFrame.
+
+    With a fitted FeatureEncoder the categorical fields are added as their codes.
+    """
+    features = {name: float(values.get(name, default)) for name, default in CUSTOMER_FIELDS.items()}
+    if encoder is not None:
+        for name, default in CUSTOMER_CATEGORIES.items():
+            if name in encoder.categories:
+                features[name] = encoder.code(name, values.get(name, default))
+    features['total_spent'] = sum(features[col] for col in SPEND_COLS)
+    features['total_purchases'] = sum(features[col] for col in PURCHASE_COLS)
+    features['children'] = features['num_children'] + features['num_teenagers']
+    features['family_size'] = features['children'] + (2 if values.get('marital_status', 'Single') in PARTNER_STATUSES else 1)
+    return features
+
+def preprocess_data(df, fill_values=None):
+    """
+    Impute missing values and add the derived features, returning a new frame.
+
+    fill_values comes from fit_imputation; pass the training-time values to
+    score new data consistently, otherwise they are computed from df itself.
+    """
+    if fill_values is None:
+        fill_values = fit_imputation(df)
+    df = impute_missing(df, fill_values)
+    return df.assign(**engineer_features(df))
+
+def select_clustering_features(df):
+    """Return the candidate clustering features present in df that are numeric or encodable"""
+    return [col for col in CLUSTERING_FEATURES
+            if col in df.columns and (is_numeric_dtype(df[col]) or col in CATEGORICAL_FEATURES)]
+
+def _build_kmeans(n_clusters, n_rows, random_state=0):
+    """Full-batch K-Means for small data, mini-batch K-Means above MINIBATCH_THRESHOLD rows"""
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    if n_rows > MINIBATCH_THRESHOLD:
+        return MiniBatchKMeans(n_clusters=n_clusters, init='k-means++', batch_size=MINIBATCH_SIZE,
+                               n_init=3, random_state=random_state)
+    return KMeans(n_clusters=n_clusters, init='k-means++', n_init='auto', random_state=random_state)
+
+def _score_k(X, X_sample, n_clusters, random_state=0):
+    """Fit n_clusters on X and return (inertia, silhouette score on X_sample)"""
+    from sklearn.metrics import silhouette_score
+    kmeans = _build_kmeans(n_clusters, len(X), random_state).fit(X)
+    labels = kmeans.predict(X_sample)
+    score = silhouette_score(X_sample, labels) if len(np.unique(labels)) > 1 else -1.0
+    return kmeans.inertia_ / len(X), score
+
+def select_n_clusters(X, candidates=K_CANDIDATES, method='silhouette', max_workers=None, random_state=0):
+    """
+    Pick the number of clusters for the scaled matrix X.
+
+    Every candidate k is fitted in parallel on a sample of at most
+    K_SELECTION_FIT_SIZE rows. 'silhouette' takes the best silhouette score on
+    a SILHOUETTE_SAMPLE_SIZE subsample, 'elbow' the sharpest bend in inertia.
+    """
+    from threadpoolctl import threadpool_limits
+
+    candidates = [k for k in candidates if 1 < k < len(X)]
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else 1
+
+    rng = np.random.default_rng(random_state)
+    X_fit = X[rng.choice(len(X), K_SELECTION_FIT_SIZE, replace=False)] if len(X) > K_SELECTION_FIT_SIZE else X
+    X_sample = X_fit[rng.choice(len(X_fit), SILHOUETTE_SAMPLE_SIZE, replace=False)] if len(X_fit) > SILHOUETTE_SAMPLE_SIZE else X_fit
+
+    # K-Means releases the GIL, so candidates run on threads without copying X;
+    # each fit is kept single-threaded so the candidates don't oversubscribe cores
+    max_workers = max_workers or min(len(candidates), os.cpu_count() or 1)
+    with threadpool_limits(limits=1), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda k: _score_k(X_fit, X_sample, k, random_state), candidates))
+    inertias, scores = (np.array(values) for values in zip(*results))
+
+    if method == 'elbow':
+        if len(candidates) < 3:
+            return candidates[0]
+        # Largest second difference of the inertia curve
+        return candidates[int(np.argmax(np.diff(inertias, 2))) + 1]
+    return candidates[int(np.argmax(scores))]
+
+def fit_clustering(df, n_clusters=2, method='silhouette', power_features=POWER_FEATURES):
+    """
+    Fit encoder, scaler and K-Means on df and return (clusters, features, encoder, scaler, kmeans).
+
+    n_clusters='auto' chooses k with select_n_clusters. String features are
+    encoded by a FeatureEncoder fitted here, which also power-transforms
+    power_features. Features are scaled to float32 and datasets over
+    MINIBATCH_THRESHOLD rows use MiniBatchKMeans.
+    """
+    from sklearn.preprocessing import MinMaxScaler
+
+    clustering_features = select_clustering_features(df)
+
+    if not clustering_features:
+        return None, None, None, None, None
+
+    # Encode and scale features
+    encoder = FeatureEncoder.fit(df, [col for col in power_features if col in clustering_features])
+    scaler = MinMaxScaler()
+    X_scaled = scaler.fit_transform(encoder.transform(df, clustering_features))
+
+    if n_clusters == 'auto':
+        n_clusters = select_n_clusters(X_scaled, method=method)
+    kmeans = _build_kmeans(n_clusters, len(X_scaled))
+    clusters = kmeans.fit_predict(X_scaled)
+
+    # Relabel so cluster 0 is always the highest-spending segment, keeping IDs
+    # stable between fits and consistent with the cluster profiles
+    if 'total_spent' in df.columns:
+        spend_by_cluster = pd.Series(df['total_spent'].to_numpy()).groupby(clusters).mean()
+        order = spend_by_cluster.reindex(range(n_clusters)).fillna(-np.inf).to_numpy().argsort()[::-1]
+        remap = np.empty(n_clusters, dtype=int)
+        remap[order] = np.arange(n_clusters)
+        kmeans.cluster_centers_ = kmeans.cluster_centers_[order]
+        kmeans.labels_ = remap[kmeans.labels_]
+        clusters = remap[clusters]
+
+    return clusters, clustering_features, encoder, scaler, kmeans
+
+def perform_clustering(df, n_clusters='auto'):
+    """Cluster an uploaded dataset, letting the data choose the number of segments"""
+    clusters, clustering_features, _, _, _ = fit_clustering(df, n_clusters=n_clusters)
+    return clusters, clustering_features
@@ -0,0 +1,190 @@
+"""
+Frozen segmentation model for Retail Buyer Segmentation
+Persists the categorical encoder, scaler, centroids and feature list of a
+clustering fit so new customers are assigned by nearest-centroid lookup with
+stable segment IDs, and folds new batches into the centroids incrementally
+instead of refitting.
+
+Usage: python segmentation_model.py refresh <file.csv> [<file.csv> ...]
+"""
+
+import os
+import sys
+import hashlib
+import pickle
+import numpy as np
+import pandas as pd
+
+from segmentation import preprocess_data, fit_imputation, fit_clustering
+from encoding import FeatureEncoder
+from columnar import read_table
+from storage import atomic_write, atomic_pickle
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+CURRENT_POINTER = 'segmentation-current'
+REFRESH_CHUNK_SIZE = 100000
+
+def align_centers(previous, centers):
+    """Return the permutation of centers that best matches the previous centroids"""
+    from scipy.optimize import linear_sum_assignment
+
+    cost = ((previous[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    _, order = linear_sum_assignment(cost)
+    return order
+
+class SegmentationModel:
+    """Encoder, scaler, centroids and imputation values that new customers are assigned against"""
+
+    def __init__(self, scaler, centers, counts, features, fill_values, parent=None, encoder=None):
+        self.scaler = scaler
+        self.encoder = encoder or FeatureEncoder({}, {})
+        self.centers = np.asarray(centers, dtype=np.float32)
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.features = list(features)
+        self.fill_values = fill_values
+        self.parent = parent
+        digest = hashlib.sha256(self.centers.tobytes())
+        digest.update(','.join(self.features).encode())
+        self.version = digest.hexdigest()[:16]
+
+    def __setstate__(self, state):
+        # Artifacts saved before categorical encoding only had numeric features
+        state.setdefault('encoder', FeatureEncoder({}, {}))
+        self.__dict__.update(state)
+
+    @property
+    def n_clusters(self):
+        return len(self.centers)
+
+    @classmethod
+    def fit(cls, raw_df, n_clusters=2, previous=None):
+        """Fit a new model on raw customer data, keeping the segment IDs of previous"""
+        fill_values = fit_imputation(raw_df)
+        df = preprocess_data(raw_df, fill_values)
+        clusters, features, encoder, scaler, kmeans = fit_clustering(df, n_clusters=n_clusters)
+        if clusters is None:
+            raise ValueError('Data has no clustering features')
+        centers = kmeans.cluster_centers_
+        counts = np.bincount(clusters, minlength=len(centers))
+        if previous is not None and previous.features == features and previous.n_clusters == len(centers):
+            order = align_centers(previous.centers, centers)
+            centers, counts = centers[order], counts[order]
+        return cls(scaler, centers, counts, features, fill_values, parent=previous.version if previous else None,
+                   encoder=encoder)
+
+    def missing_features(self, df):
+        """Clustering features absent from a preprocessed frame"""
+        return [col for col in self.features if col not in df.columns]
+
+    def feature_matrix(self, df):
+        """Encoded, unscaled features of a preprocessed frame, as the classifiers are trained on"""
+        return self.encoder.encode(df)[self.features].to_numpy(dtype=float)
+
+    def transform(self, df):
+        """Encode and scale the clustering features of a preprocessed frame"""
+        return self.scaler.transform(self.encoder.transform(df, self.features)).astype(np.float32, copy=False)
+
+    def nearest(self, X):
+        """Nearest centroid of every row of a scaled matrix, returning (clusters, distances)"""
+        # Squared distances via |x|^2 - 2x.c + |c|^2, without an n x k x d temporary
+        sq = (X * X).sum(axis=1)[:, None] - 2 * X @ self.centers.T + (self.centers * self.centers).sum(axis=1)
+        clusters = sq.argmin(axis=1)
+        distances = np.sqrt(np.maximum(sq[np.arange(len(X)), clusters], 0))
+        return clusters, distances
+
+    def assign(self, df):
+        """Assign every row of a preprocessed frame to its nearest centroid, returning (clusters, distances)"""
+        return self.nearest(self.transform(df))
+
+    def prepare(self, raw_df):
+        """Preprocess raw customer data with the training statistics"""
+        df = preprocess_data(raw_df, self.fill_values)
+        missing = self.missing_features(df)
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        return df
+
+    def predict(self, raw_df):
+        """Preprocess and assign raw customer data, returning (df, (clusters, distances))"""
+        df = self.prepare(raw_df)
+        return df, self.assign(df)
+
+    def partial_fit(self, raw_df, decay=1.0):
+        """
+        Fold a batch of raw customer data into the centroids and return the new model.
+
+        Each centroid moves to the running mean of the points assigned to it,
+        as in mini-batch K-Means; decay < 1 down-weights the history so recent
+        batches count more. The result keeps this model's segment IDs.
+        """
+        from scipy.sparse import csr_matrix
+
+        X = self.transform(self.prepare(raw_df))
+        clusters, _ = self.nearest(X)
+
+        # Per-cluster sums as one sparse indicator product
+        indicator = csr_matrix((np.ones(len(X), dtype=np.float32), (clusters, np.arange(len(X)))),
+                               shape=(self.n_clusters, len(X)))
+        sums = np.asarray(indicator @ X, dtype=np.float64)
+        counts = self.counts * decay + np.bincount(clusters, minlength=self.n_clusters)
+        centers = (self.centers * (self.counts * decay)[:, None] + sums) / np.maximum(counts, 1)[:, None]
+
+        order = align_centers(self.centers, centers)
+        return SegmentationModel(self.scaler, centers[order], counts[order], self.features, self.fill_values,
+                                 parent=self.version, encoder=self.encoder)
+
+    def save(self, model_dir=DEFAULT_MODEL_DIR):
+        """Write the model to a versioned artifact and return its path"""
+        os.makedirs(model_dir, exist_ok=True)
+        path = os.path.join(model_dir, f'segmentation-{self.version}.pkl')
+        atomic_pickle(self, path)
+        return path
+
+    def make_current(self, model_dir=DEFAULT_MODEL_DIR):
+        """Save the model and point the current-version pointer at it"""
+        self.save(model_dir)
+        pointer = os.path.join(model_dir, CURRENT_POINTER)
+        with atomic_write(pointer, 'w') as f:
+            f.write(self.version)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model artifact from disk"""
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    @classmethod
+    def load_current(cls, model_dir=DEFAULT_MODEL_DIR):
+        """Load the current model version, or None if none has been saved"""
+        pointer = os.path.join(model_dir, CURRENT_POINTER)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer) as f:
+            version = f.read().strip()
+        return cls.load(os.path.join(model_dir, f'segmentation-{version}.pkl'))
+
+def refresh_current(paths, model_dir=DEFAULT_MODEL_DIR, chunksize=REFRESH_CHUNK_SIZE, decay=1.0):
+    """Fold new customer files into the current model chunk by chunk and make the result current"""
+    model = previous = SegmentationModel.load_current(model_dir)
+    if model is None:
+        raise RuntimeError('No current segmentation model to refresh')
+    for path in paths:
+        if path.endswith('.parquet'):
+            chunks = [read_table(path)]
+        else:
+            chunks = pd.read_csv(path, chunksize=chunksize)
+        for chunk in chunks:
+            model = model.partial_fit(chunk, decay=decay)
+    # The per-chunk models in between are never saved; the published one
+    # descends from the model that was current when the refresh started
+    model.parent = previous.version
+    model.make_current(model_dir)
+    return model
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'refresh':
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    previous = SegmentationModel.load_current()
+    refreshed = refresh_current(sys.argv[2:])
+    print(f"Refreshed segmentation model {previous.version} -> {refreshed.version}")
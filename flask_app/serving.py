@@ -0,0 +1,143 @@
+"""
+Shared model serving for Retail Buyer Segmentation
+Publishes the fitted classifier registry, the frozen segmentation model and
+the reference customers' similar-customer index as one versioned bundle of
+uncompressed joblib files. Web worker processes load the bundle with
+memory-mapped arrays, so the feature matrices, centroids and neighbor
+indexes live once in the OS page cache however many workers attach to them.
+Tree classifiers are published as compiled_trees node arrays, which are
+shared the same way and spare the workers the xgboost import.
+
+A bundle is written to a temporary directory and renamed into place, and
+the current-version pointer is replaced atomically, so workers swap to a
+newly published version between requests without a restart.
+
+Usage: python serving.py publish
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import threading
+
+from segmentation_model import DEFAULT_MODEL_DIR
+from storage import temp_path, atomic_write
+
+DEFAULT_SERVING_DIR = os.path.join(DEFAULT_MODEL_DIR, 'serving')
+CURRENT_POINTER = 'current'
+RELOAD_INTERVAL = 5.0  # Seconds between checks of the current-version pointer
+KEEP_VERSIONS = 3  # Published bundles kept on disk, so workers still on an older one can finish
+COMPONENTS = ('registry', 'segmentation', 'similarity')
+
+def bundle_version(registry, segmentation):
+    """Version of a bundle, derived from the versions of its models and the form the classifiers take"""
+    parts = [registry.version if registry is not None else '', segmentation.version if segmentation is not None else '']
+    if registry is not None:
+        parts += [f'{code}:{type(model).__name__}' for code, model in sorted(registry.models.items())]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:16]
+
+def publish(registry, segmentation, similarity, serving_dir=DEFAULT_SERVING_DIR, keep=KEEP_VERSIONS):
+    """Write a bundle, make it the current version and return that version"""
+    import joblib
+
+    version = bundle_version(registry, segmentation)
+    path = os.path.join(serving_dir, version)
+    if not os.path.isdir(path):
+        tmp_path = temp_path(path)
+        os.makedirs(tmp_path)
+        try:
+            for name, component in zip(COMPONENTS, (registry, segmentation, similarity)):
+                if component is not None:
+                    # Uncompressed, so numpy arrays can be memory-mapped on load
+                    joblib.dump(component, os.path.join(tmp_path, f'{name}.joblib'))
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process published the same version first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+
+    pointer = os.path.join(serving_dir, CURRENT_POINTER)
+    with atomic_write(pointer, 'w') as f:
+        f.write(version)
+    prune(serving_dir, keep)
+    return version
+
+def prune(serving_dir=DEFAULT_SERVING_DIR, keep=KEEP_VERSIONS):
+    """Delete all but the keep most recently published bundles"""
+    bundles = sorted((entry for entry in os.scandir(serving_dir) if entry.is_dir() and not entry.name.startswith('.')),
+                     key=lambda entry: entry.stat().st_mtime, reverse=True)
+    current = current_version(serving_dir)
+    for entry in bundles[keep:]:
+        if entry.name != current:
+            # Workers that still map these files keep them until they swap
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def current_version(serving_dir=DEFAULT_SERVING_DIR):
+    """Version the pointer currently names, or None if nothing was published"""
+    try:
+        with open(os.path.join(serving_dir, CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load(version, serving_dir=DEFAULT_SERVING_DIR, mmap=True):
+    """Load a published bundle as {component: object}, with arrays memory-mapped read-only"""
+    import joblib
+
+    bundle = {'version': version}
+    for name in COMPONENTS:
+        path = os.path.join(serving_dir, version, f'{name}.joblib')
+        bundle[name] = joblib.load(path, mmap_mode='r' if mmap else None) if os.path.exists(path) else None
+    return bundle
+
+class SharedModels:
+    """The current bundle of a serving directory, swapped when a new version is published"""
+
+    def __init__(self, serving_dir=DEFAULT_SERVING_DIR, reload_interval=RELOAD_INTERVAL, mmap=True):
+        self.serving_dir = serving_dir
+        self.reload_interval = reload_interval
+        self.mmap = mmap
+        self._bundle = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current bundle, or None if nothing was published; checks the pointer at most every reload_interval"""
+        bundle = self._bundle
+        if bundle is not None and time.monotonic() - self._checked < self.reload_interval:
+            return bundle
+        with self._lock:
+            self._checked = time.monotonic()
+            version = current_version(self.serving_dir)
+            if version is not None and (self._bundle is None or self._bundle['version'] != version):
+                start = time.perf_counter()
+                # Requests already running keep the bundle they started with
+                self._bundle = load(version, self.serving_dir, self.mmap)
+                print(f"Attached model bundle {version} in {time.perf_counter() - start:.2f}s (pid {os.getpid()})")
+            return self._bundle
+
+def publish_current(serving_dir=DEFAULT_SERVING_DIR, compiled_trees=True):
+    """Publish the current registry, segmentation model and reference index"""
+    from model_registry import ModelRegistry, DEFAULT_DATA_PATH
+    from segmentation_model import SegmentationModel
+    from similarity import load_or_build_reference
+
+    registry = ModelRegistry.load_or_train()
+    segmentation = SegmentationModel.load_current()
+    if segmentation is None:
+        segmentation = registry.segmenter
+        segmentation.make_current()
+    similarity = load_or_build_reference(segmentation, DEFAULT_DATA_PATH)
+    if compiled_trees:
+        # Workers then score tree models without importing xgboost
+        registry = registry.compiled()
+    return publish(registry, segmentation, similarity, serving_dir)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] != 'publish':
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    print(f"Published model bundle {publish_current()}")
@@ -0,0 +1,118 @@
+"""
+Similar-customer lookup for Retail Buyer Segmentation
+Indexes customers in the scaled clustering feature space of a segmentation
+model with one KD-tree per segment, so "the customers most like this one"
+is a tree query inside the customer's own segment instead of a scan over
+every row. Neighbors are only searched within the same segment, which can
+miss a closer customer just across a segment boundary.
+"""
+
+import os
+import pickle
+import numpy as np
+
+from segmentation_model import DEFAULT_MODEL_DIR
+from storage import atomic_pickle
+
+DEFAULT_NEIGHBORS = 50
+MAX_NEIGHBORS = 500
+LEAF_SIZE = 40
+
+class SimilarityIndex:
+    """Per-segment KD-trees over scaled customer features, addressed by customer ID"""
+
+    def __init__(self, trees, members, clusters, customer_ids, model_version):
+        self.trees = trees
+        self.members = members
+        self.clusters = clusters
+        self.model_version = model_version
+        self.ids = np.asarray(customer_ids)
+        # Sorted IDs for binary-search lookup without a per-customer dict
+        self._order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._order]
+
+    @classmethod
+    def build(cls, X, customer_ids, clusters, model_version, leaf_size=LEAF_SIZE):
+        """Index the scaled feature matrix X of customers assigned to clusters"""
+        from sklearn.neighbors import KDTree
+
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        clusters = np.asarray(clusters, dtype=np.int32)
+        trees, members = {}, {}
+        for cluster in np.unique(clusters):
+            rows = np.flatnonzero(clusters == cluster)
+            trees[int(cluster)] = KDTree(X[rows], leaf_size=leaf_size)
+            members[int(cluster)] = rows
+        return cls(trees, members, clusters, customer_ids, model_version)
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def row_of(self, customer_id):
+        """Row of a customer in the indexed data, or None"""
+        i = np.searchsorted(self._sorted_ids, customer_id)
+        if i == len(self._sorted_ids) or self._sorted_ids[i] != customer_id:
+            return None
+        return int(self._order[i])
+
+    def query(self, customer_id, k=DEFAULT_NEIGHBORS):
+        """
+        Return (rows, distances) of the k customers closest to customer_id in its segment.
+
+        Rows index the data the index was built from, nearest first, without
+        the customer itself. Raises KeyError for an unknown customer.
+        """
+        row = self.row_of(customer_id)
+        if row is None:
+            raise KeyError(customer_id)
+        cluster = int(self.clusters[row])
+        tree, members = self.trees[cluster], self.members[cluster]
+        point = np.asarray(tree.data)[np.searchsorted(members, row)]
+        distances, positions = tree.query(point[None, :], k=min(k + 1, len(members)))
+        rows = members[positions[0]]
+        keep = rows != row
+        return rows[keep][:k], distances[0][keep][:k]
+
+    def save(self, path):
+        """Write the index atomically"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        atomic_pickle(self, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index from disk, or None if there is none"""
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+def index_segmented(segmenter, df, X=None, clusters=None):
+    """
+    Build the index of a preprocessed frame with a customer_id column, scaled and assigned by segmenter.
+
+    Customers without an ID cannot be looked up and are left out.
+    """
+    if X is None:
+        X = segmenter.transform(df)
+    if clusters is None:
+        clusters, _ = segmenter.nearest(X)
+    known = df['customer_id'].notna().to_numpy()
+    return SimilarityIndex.build(X[known], df['customer_id'][known].to_numpy(dtype=np.int64),
+                                 np.asarray(clusters)[known], segmenter.version)
+
+def reference_index_path(segmenter, model_dir=DEFAULT_MODEL_DIR):
+    """Path of the reference customers' index, kept next to the segmentation model it was built with"""
+    return os.path.join(model_dir, f'similarity-{segmenter.version}.pkl')
+
+def load_or_build_reference(segmenter, data_path, model_dir=DEFAULT_MODEL_DIR):
+    """Index of the reference customers under segmenter, built and saved on first use"""
+    path = reference_index_path(segmenter, model_dir)
+    index = SimilarityIndex.load(path)
+    if index is None:
+        from columnar import load_customers
+
+        df = segmenter.prepare(load_customers(data_path))
+        index = index_segmented(segmenter, df)
+        index.save(path)
+    return index
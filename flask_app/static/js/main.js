@@ -110,8 +110,16 @@ document.addEventListener('DOMContentLoaded', function() {
                     return;
                 }
 
-                // Validate file size (16MB max)
-                if (fileSize > 16) {
+                // Files over 16MB are processed in streaming mode
+                const uploadForm = this.closest('form');
+                if (uploadForm && uploadForm.dataset.streamAction) {
+                    if (!uploadForm.dataset.defaultAction) {
+                        uploadForm.dataset.defaultAction = uploadForm.getAttribute('action');
+                    }
+                    uploadForm.setAttribute('action', fileSize > 16
+                        ? uploadForm.dataset.streamAction
+                        : uploadForm.dataset.defaultAction);
+                } else if (fileSize > 16) {
                     alert('File size must be less than 16MB.');
                     this.value = '';
                     return;
@@ -0,0 +1,110 @@
+"""
+File storage helpers for Retail Buyer Segmentation
+Files are written to a uniquely named temporary file in the target's
+directory and renamed over the target, so readers never see a partial file
+and concurrent writers of the same path never share a temporary file.
+BoundedDirectory is the base of the on-disk stores that keep their most
+recently used entries in memory and evict the least recently used ones.
+"""
+
+import os
+import uuid
+import pickle
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+def temp_path(path):
+    """Unique temporary file name in the directory of path"""
+    return os.path.join(os.path.dirname(path), f'.{uuid.uuid4().hex}.tmp')
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    """Open a temporary file that replaces path when the with block finishes, or is discarded on an error"""
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_pickle(obj, path):
+    """Pickle obj to path atomically"""
+    with atomic_write(path) as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+class BoundedDirectory:
+    """
+    Entries stored as files in one directory, with an in-memory layer of the
+    most recently used ones and least-recently-used eviction beyond max_entries.
+
+    Subclasses set entry_ext, the extension of the file that marks an entry
+    (its modification time is the LRU clock), and extend entry_files and
+    memory_keys when an entry has more files or in-memory values.
+    """
+
+    entry_ext = None
+    # Class-level, so stores stay picklable for the job workers
+    _lock = threading.Lock()
+
+    def __init__(self, directory, max_entries, memory_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Job workers only write to disk; each process keeps its own memory layer
+        state = self.__dict__.copy()
+        state['_memory'] = OrderedDict()
+        return state
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, f'{key}{self.entry_ext}')
+
+    def entry_files(self, key):
+        """Files deleted with an entry"""
+        return [self.entry_path(key)]
+
+    def memory_keys(self, key):
+        """In-memory values dropped with an entry"""
+        return [key]
+
+    def _recall(self, key):
+        """Value kept in memory under key, or None"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+            return value
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def evict(self):
+        """Delete the least recently used entries beyond max_entries"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(self.entry_ext) and not entry.name.startswith('.'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.name[:-len(self.entry_ext)]))
+                    except FileNotFoundError:
+                        continue
+            entries.sort()
+            for _, key in entries[:max(len(entries) - self.max_entries, 0)]:
+                for memory_key in self.memory_keys(key):
+                    self._memory.pop(memory_key, None)
+                for path in self.entry_files(key):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
@@ -0,0 +1,138 @@
+"""
+Streaming CSV ingestion for Retail Buyer Segmentation
+Reads large uploads in fixed-size chunks, assigns each chunk to the frozen
+segmentation centroids and keeps only running aggregates plus a bounded
+sample in memory.
+"""
+
+import numpy as np
+import pandas as pd
+
+from segmentation import SPEND_COLS
+
+CHUNK_SIZE = 50000
+SAMPLE_SIZE = 10000
+
+# Explicit dtypes for the Data/data.csv schema; counts are floats so missing
+# values survive parsing and can be imputed by preprocess_data, as in the
+# non-streaming upload path. Missing customer IDs are never imputed and stay null.
+CSV_DTYPES = {
+    'customer_id': 'Int64',
+    'birth_year': 'float32',
+    'education_level': 'object',
+    'marital_status': 'object',
+    'annual_income': 'float64',
+    'num_children': 'float32',
+    'num_teenagers': 'float32',
+    'signup_date': 'object',
+    'days_since_last_purchase': 'float32',
+    'has_recent_complaint': 'float32',
+    'spend_wine': 'float32',
+    'spend_fruits': 'float32',
+    'spend_meat': 'float32',
+    'spend_fish': 'float32',
+    'spend_sweets': 'float32',
+    'spend_gold': 'float32',
+    'num_discount_purchases': 'float32',
+    'num_web_purchases': 'float32',
+    'num_catalog_purchases': 'float32',
+    'num_store_purchases': 'float32',
+    'web_visits_last_month': 'float32',
+    'accepted_campaign_1': 'float32',
+    'accepted_campaign_2': 'float32',
+    'accepted_campaign_3': 'float32',
+    'accepted_campaign_4': 'float32',
+    'accepted_campaign_5': 'float32',
+    'accepted_last_campaign': 'float32',
+    'age': 'float32',
+}
+
+class RunningStats:
+    """Running aggregates behind the summary statistics of the insights page"""
+
+    def __init__(self):
+        self.count = 0
+        self.sums = {}
+        self.counts = {}
+        self.cluster_counts = {}
+
+    def _add(self, name, series):
+        self.sums[name] = self.sums.get(name, 0.0) + float(series.sum())
+        self.counts[name] = self.counts.get(name, 0) + int(series.count())
+
+    def update(self, df, clusters=None):
+        """Fold one processed chunk into the aggregates"""
+        self.count += len(df)
+        for col in ['annual_income', 'age', 'total_spent'] + SPEND_COLS:
+            if col in df.columns:
+                self._add(col, df[col])
+        if clusters is not None:
+            ids, counts = np.unique(clusters, return_counts=True)
+            for cluster_id, n in zip(ids.tolist(), counts.tolist()):
+                self.cluster_counts[cluster_id] = self.cluster_counts.get(cluster_id, 0) + n
+
+    def mean(self, name):
+        """Mean of a tracked column, or None if it was never seen"""
+        if not self.counts.get(name):
+            return None
+        return self.sums[name] / self.counts[name]
+
+    def to_stats(self):
+        """Format the aggregates like the stats of a regular upload"""
+        avg_income = self.mean('annual_income')
+        avg_age = self.mean('age')
+        avg_spending = self.mean('total_spent')
+        stats = {
+            'total_customers': self.count,
+            'avg_income': f"${avg_income:.2f}" if avg_income is not None else 'N/A',
+            'avg_age': f"{avg_age:.1f}" if avg_age is not None else 'N/A',
+            'total_revenue': f"${self.sums['total_spent']:.2f}" if avg_spending is not None else 'N/A',
+            'avg_spending': f"${avg_spending:.2f}" if avg_spending is not None else 'N/A',
+        }
+        if self.cluster_counts:
+            stats['num_segments'] = len(self.cluster_counts)
+        return stats
+
+    def totals(self):
+        """Customers per cluster and mean spending per category over every row, for plot_specs"""
+        totals = {}
+        if self.cluster_counts:
+            totals['cluster_counts'] = pd.Series(self.cluster_counts, name='cluster').sort_index()
+        spending_means = {col: self.mean(col) for col in SPEND_COLS if self.mean(col) is not None}
+        if spending_means:
+            totals['spending_means'] = pd.Series(spending_means)
+        return totals
+
+def stream_segment_csv(source, segmenter, chunksize=CHUNK_SIZE, sample_size=SAMPLE_SIZE, random_state=0, sink=None):
+    """
+    Segment a CSV file chunk by chunk against a frozen SegmentationModel.
+
+    Returns (stats, sample, totals): sample is a uniform random sample of at
+    most sample_size processed rows, including their 'cluster' column, and
+    totals the chart aggregates of all rows (see RunningStats.totals). sink, when
+    given, is called with every segmented chunk, e.g. to keep the full result
+    for the data explorer.
+    """
+    rng = np.random.default_rng(random_state)
+    stats = RunningStats()
+    sample = None
+
+    for chunk in pd.read_csv(source, chunksize=chunksize, dtype=CSV_DTYPES):
+        # Impute with the training statistics so every chunk is filled alike
+        chunk = segmenter.prepare(chunk)
+        clusters, _ = segmenter.assign(chunk)
+        chunk['cluster'] = clusters
+        stats.update(chunk, clusters)
+        if sink is not None:
+            sink(chunk)
+
+        # Reservoir sample: keep the rows with the smallest random keys seen so far
+        chunk['_sample_key'] = rng.random(len(chunk))
+        candidates = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+        sample = candidates.nsmallest(sample_size, '_sample_key')
+
+    if sample is None:
+        raise ValueError('The uploaded file contains no rows')
+
+    sample = sample.sort_index().drop(columns='_sample_key').reset_index(drop=True)
+    return stats.to_stats(), sample, stats.totals()
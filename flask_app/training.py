@@ -0,0 +1,198 @@
+"""
+Training harness for Retail Buyer Segmentation
+Cross-validates every classifier in MODEL_BUILDERS against the K-Means
+segments of a customer dataset, running all (model, fold) fits in parallel
+on a process pool, and prints a leaderboard of accuracy, F1 and fit and
+inference latency. The preprocessed feature matrix is built once per dataset
+and cached on disk, where the workers memory-map it.
+
+Usage:
+    python training.py [data.csv] [--folds 5] [--workers N] [--models rf xgb ...]
+                       [--output leaderboard.json] [--save]
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from model_registry import (ModelRegistry, MODEL_BUILDERS, DEFAULT_DATA_PATH, DEFAULT_MODEL_DIR, build_pipeline,
+                            _fingerprint)
+from segmentation_model import SegmentationModel
+from storage import atomic_pickle
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'features')
+DEFAULT_FOLDS = 5
+LATENCY_SAMPLES = 50  # Single-row predictions timed per fold
+
+def feature_matrix(data_path=DEFAULT_DATA_PATH, cache_dir=FEATURE_CACHE_DIR):
+    """
+    Build or load the cached training set of a dataset.
+
+    Returns (x_path, y_path, meta): the feature matrix and K-Means labels as
+    .npy files, and a dict with the feature names and fitted segmenter. The
+    cache key is the registry fingerprint, so it follows the data and code.
+    """
+    key = _fingerprint(data_path)
+    x_path = os.path.join(cache_dir, f'{key}-X.npy')
+    y_path = os.path.join(cache_dir, f'{key}-y.npy')
+    meta_path = os.path.join(cache_dir, f'{key}-meta.pkl')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'rb') as f:
+            return x_path, y_path, pickle.load(f)
+
+    raw = pd.read_csv(data_path)
+    segmenter = SegmentationModel.fit(raw)
+    df, (clusters, _) = segmenter.predict(raw)
+    meta = {'version': key, 'features': segmenter.features, 'segmenter': segmenter}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(x_path, segmenter.feature_matrix(df))
+    np.save(y_path, clusters)
+    # The metadata file is written last: it marks the entry as complete
+    atomic_pickle(meta, meta_path)
+    return x_path, y_path, meta
+
+# Training set of a worker process, memory-mapped once by _init_worker
+_X = None
+_y = None
+
+def _init_worker(x_path, y_path):
+    global _X, _y
+    from threadpoolctl import threadpool_limits
+
+    # One fit per core; nested BLAS/OpenMP threads would only oversubscribe it
+    threadpool_limits(limits=1)
+    _X = np.load(x_path, mmap_mode='r')
+    _y = np.load(y_path, mmap_mode='r')
+
+def _evaluate(code, fold, train_idx, test_idx):
+    """Fit one model on one fold and score it on the held-out rows"""
+    from sklearn.metrics import accuracy_score, f1_score, confusion_matrix
+
+    pipeline = build_pipeline(code)
+    start = time.perf_counter()
+    pipeline.fit(_X[train_idx], _y[train_idx])
+    fit_seconds = time.perf_counter() - start
+
+    X_test, y_test = _X[test_idx], _y[test_idx]
+    start = time.perf_counter()
+    predicted = pipeline.predict(X_test)
+    batch_seconds = time.perf_counter() - start
+
+    # Single-row latency, as seen by /api/v1/predict without batching
+    single = []
+    for i in range(min(LATENCY_SAMPLES, len(X_test))):
+        start = time.perf_counter()
+        pipeline.predict(X_test[i:i + 1])
+        single.append(time.perf_counter() - start)
+
+    return {
+        'model': code,
+        'fold': fold,
+        'accuracy': accuracy_score(y_test, predicted),
+        'f1': f1_score(y_test, predicted, average='macro'),
+        'confusion_matrix': confusion_matrix(y_test, predicted, labels=np.unique(_y)).tolist(),
+        'fit_seconds': fit_seconds,
+        'predict_us_per_row': batch_seconds / len(X_test) * 1e6,
+        'single_row_ms': float(np.median(single)) * 1e3,
+    }
+
+def _fit_full(code):
+    """Fit one model on the whole training set"""
+    pipeline = build_pipeline(code)
+    pipeline.fit(_X, _y)
+    return code, pipeline
+
+def _executor(x_path, y_path, max_workers):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(x_path, y_path))
+
+def cross_validate(x_path, y_path, codes=None, folds=DEFAULT_FOLDS, max_workers=None, random_state=0):
+    """Run stratified k-fold cross-validation of every model, all (model, fold) pairs in parallel"""
+    from sklearn.model_selection import StratifiedKFold
+
+    codes = codes or list(MODEL_BUILDERS)
+    y = np.load(y_path)
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state).split(np.zeros(len(y)), y))
+
+    with _executor(x_path, y_path, max_workers) as executor:
+        futures = [executor.submit(_evaluate, code, fold, train_idx.astype(np.int32), test_idx.astype(np.int32))
+                   for code in codes for fold, (train_idx, test_idx) in enumerate(splits)]
+        return [future.result() for future in futures]
+
+def fit_all(x_path, y_path, codes=None, max_workers=None):
+    """Fit every model on the whole training set in parallel and return {code: pipeline}"""
+    codes = codes or list(MODEL_BUILDERS)
+    with _executor(x_path, y_path, max_workers) as executor:
+        return dict(executor.map(_fit_full, codes))
+
+def leaderboard(results):
+    """Per-model means over the folds, best macro F1 first"""
+    df = pd.DataFrame(results)
+    board = df.groupby('model').agg(
+        accuracy=('accuracy', 'mean'),
+        accuracy_std=('accuracy', 'std'),
+        f1=('f1', 'mean'),
+        f1_std=('f1', 'std'),
+        fit_seconds=('fit_seconds', 'mean'),
+        predict_us_per_row=('predict_us_per_row', 'mean'),
+        single_row_ms=('single_row_ms', 'median'),
+    )
+    board['confusion_matrix'] = [np.sum([r['confusion_matrix'] for r in results if r['model'] == code], axis=0).tolist()
+                                 for code in board.index]
+    return board.sort_values(['f1', 'accuracy'], ascending=False).reset_index()
+
+def format_leaderboard(board):
+    """Leaderboard as a fixed-width text table"""
+    lines = [f"{'model':<6} {'accuracy':>15} {'f1 (macro)':>15} {'fit s':>8} {'predict us/row':>15} {'1-row ms':>9}"]
+    for row in board.itertuples():
+        lines.append(f"{row.model:<6} {row.accuracy:>8.4f} ±{row.accuracy_std:.4f} {row.f1:>8.4f} ±{row.f1_std:.4f} "
+                     f"{row.fit_seconds:>8.3f} {row.predict_us_per_row:>15.2f} {row.single_row_ms:>9.3f}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cross-validate and compare the segment classifiers')
+    parser.add_argument('data', nargs='?', default=DEFAULT_DATA_PATH, help='customer CSV (default: Data/data.csv)')
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--models', nargs='+', choices=sorted(MODEL_BUILDERS), default=None)
+    parser.add_argument('--output', default=None, help='write the leaderboard and per-fold results as JSON')
+    parser.add_argument('--save', action='store_true',
+                        help='also fit every model on the full data and save the registry the app loads')
+    args = parser.parse_args(argv)
+    if args.save and args.models and set(args.models) != set(MODEL_BUILDERS):
+        parser.error('--save needs the full model roster')
+
+    start = time.perf_counter()
+    x_path, y_path, meta = feature_matrix(args.data)
+    print(f"Feature matrix {meta['version']} ready in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    results = cross_validate(x_path, y_path, args.models, args.folds, args.workers)
+    board = leaderboard(results)
+    print(f"{args.folds}-fold cross-validation in {time.perf_counter() - start:.2f}s")
+    print(format_leaderboard(board))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'version': meta['version'], 'folds': args.folds,
+                       'leaderboard': board.to_dict('records'), 'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.save:
+        start = time.perf_counter()
+        models = fit_all(x_path, y_path, max_workers=args.workers)
+        path = ModelRegistry(models, meta['features'], meta['segmenter'], meta['version']).save(DEFAULT_MODEL_DIR)
+        print(f"Saved {path} in {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
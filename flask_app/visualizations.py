@@ -0,0 +1,282 @@
+"""
+Visualizations for Retail Buyer Segmentation
+Renders the upload insight charts to PNG files.
+
+Charts are drawn with the object-oriented Figure API (no global pyplot
+state), so rendering is thread-safe. Each image is named after a hash of the
+data it plots, making files content-addressed: concurrent uploads never
+overwrite each other and re-uploading the same data reuses the cached PNGs
+without re-rendering.
+"""
+
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+from rendering import render_to_file
+from segmentation import SPEND_COLS
+from metrics import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGE_DIR = os.path.join(BASE_DIR, 'static', 'images')
+
+# Plots live in a subdirectory of the image folder so eviction never touches other assets
+PLOT_SUBDIR = 'plots'
+PLOT_CACHE_MAX_FILES = 200
+
+# Bump to invalidate cached images when chart styling changes
+PLOT_VERSION = 1
+
+# Above this many rows scatter and box plots are drawn from NumPy aggregates
+# instead of raw points, keeping render time and PNG size flat
+LARGE_DATA_THRESHOLD = 50000
+DENSITY_BINS = 120
+
+BACKGROUND = '#1a1a1a'
+SAVEFIG_KWARGS = {'facecolor': BACKGROUND, 'bbox_inches': 'tight'}
+ACCENT = '#dc143c'
+CATEGORY_COLORS = ['#dc143c', '#ff6b6b', '#c41e3a', '#ee4b2b', '#cd5c5c', '#b22222']
+
+def dataset_hash(data):
+    """Stable content hash of a DataFrame, Series, array or dict of those"""
+    digest = hashlib.sha256()
+    if isinstance(data, dict):
+        for name in sorted(data):
+            digest.update(f'{name}:{dataset_hash(data[name])}'.encode())
+        return digest.hexdigest()
+    if isinstance(data, np.ndarray):
+        digest.update(f'{data.dtype}{data.shape}'.encode())
+        digest.update(np.ascontiguousarray(data).tobytes())
+        return digest.hexdigest()
+    if isinstance(data, pd.DataFrame):
+        digest.update(','.join(map(str, data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def histogram_2d(x, y, bins=DENSITY_BINS):
+    """Bin two columns into a 2-D count grid, returned as a dict of arrays"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(y)
+    counts, xedges, yedges = np.histogram2d(x[mask], y[mask], bins=bins)
+    return {'counts': counts, 'xedges': xedges, 'yedges': yedges}
+
+def box_stats(df, by, value):
+    """
+    Per-group box plot statistics (Tukey whiskers, no fliers) for Axes.bxp.
+
+    Returns one row per group with the columns label, q1, med, q3, whislo and
+    whishi, computed with grouped quantiles instead of handing raw rows to
+    the plotting library.
+    """
+    data = df[[by, value]].dropna()
+    quartiles = data.groupby(by)[value].quantile([0.25, 0.5, 0.75]).unstack()
+    iqr = quartiles[0.75] - quartiles[0.25]
+    keys = data[by]
+    values = data[value]
+
+    # Whiskers reach the most extreme values still inside 1.5 IQR of the box
+    low_fence = keys.map(quartiles[0.25] - 1.5 * iqr)
+    high_fence = keys.map(quartiles[0.75] + 1.5 * iqr)
+    whislo = values[values >= low_fence].groupby(keys[values >= low_fence]).min()
+    whishi = values[values <= high_fence].groupby(keys[values <= high_fence]).max()
+
+    return pd.DataFrame({
+        'label': quartiles.index,
+        'q1': quartiles[0.25].to_numpy(),
+        'med': quartiles[0.5].to_numpy(),
+        'q3': quartiles[0.75].to_numpy(),
+        'whislo': whislo.reindex(quartiles.index).to_numpy(),
+        'whishi': whishi.reindex(quartiles.index).to_numpy(),
+    })
+
+class PlotCache:
+    """Directory of content-addressed PNGs with least-recently-used eviction"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, cache_dir, max_files=PLOT_CACHE_MAX_FILES):
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def filename(self, plot_type, data):
+        """Cache file name for a plot type drawn from the given data"""
+        key = hashlib.sha256(f'{plot_type}|{PLOT_VERSION}|{dataset_hash(data)}'.encode()).hexdigest()[:24]
+        return f'{plot_type}-{key}.png'
+
+    def lookup(self, plot_type, data):
+        """Return (filename, path, hit) for this plot"""
+        filename = self.filename(plot_type, data)
+        path = os.path.join(self.cache_dir, filename)
+        try:
+            # A hit refreshes the modification time used as the LRU clock
+            os.utime(path)
+            return filename, path, True
+        except FileNotFoundError:
+            return filename, path, False
+
+    def evict(self):
+        """Delete the least recently used images beyond max_files"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.png') and not entry.name.startswith('.'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        continue
+            if len(entries) <= self.max_files:
+                return
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_files]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+def _new_figure(figsize=(10, 6)):
+    """Create a standalone dark-themed figure and axes"""
+    # matplotlib is only needed where charts are drawn, usually a render worker
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    fig.patch.set_facecolor(BACKGROUND)
+    ax = fig.subplots()
+    ax.set_facecolor(BACKGROUND)
+    ax.tick_params(colors='white')
+    return fig, ax
+
+def _set_labels(ax, xlabel, ylabel, title):
+    if xlabel:
+        ax.set_xlabel(xlabel, color='white')
+    ax.set_ylabel(ylabel, color='white')
+    ax.set_title(title, color='white', fontsize=16, fontweight='bold')
+
+def plot_age_distribution(age):
+    """Histogram of customer ages"""
+    fig, ax = _new_figure()
+    ax.hist(age, bins=30, color=ACCENT, edgecolor='white', alpha=0.7)
+    _set_labels(ax, 'Age', 'Frequency', 'Age Distribution')
+    ax.grid(True, alpha=0.3)
+    return fig
+
+def plot_income_vs_spend(data):
+    """Scatter of annual income against total spending"""
+    fig, ax = _new_figure()
+    ax.scatter(data['annual_income'], data['total_spent'], alpha=0.6, c=ACCENT, edgecolors='white')
+    _set_labels(ax, 'Annual Income', 'Total Spent', 'Income vs Total Spending')
+    ax.grid(True, alpha=0.3)
+    return fig
+
+def plot_income_vs_spend_density(binned):
+    """Density of annual income against total spending from a 2-D histogram"""
+    from matplotlib.colors import LogNorm
+
+    fig, ax = _new_figure()
+    counts = np.ma.masked_equal(binned['counts'].T, 0)
+    mesh = ax.pcolormesh(binned['xedges'], binned['yedges'], counts, cmap='Reds', norm=LogNorm())
+    colorbar = fig.colorbar(mesh, ax=ax)
+    colorbar.set_label('Customers', color='white')
+    colorbar.ax.tick_params(colors='white')
+    _set_labels(ax, 'Annual Income', 'Total Spent', 'Income vs Total Spending')
+    ax.grid(True, alpha=0.3)
+    return fig
+
+def plot_cluster_distribution(cluster_counts):
+    """Bar chart of customers per cluster, from their counts indexed by cluster"""
+    fig, ax = _new_figure()
+    ax.bar(cluster_counts.index, cluster_counts.values, color=ACCENT, edgecolor='white')
+    _set_labels(ax, 'Cluster', 'Count', 'Customer Segments Distribution')
+    ax.grid(True, alpha=0.3, axis='y')
+    return fig
+
+def plot_spending_by_category(spending_means):
+    """Bar chart of average spending per product category, from the means indexed by spend column"""
+    fig, ax = _new_figure(figsize=(12, 6))
+    ax.bar(range(len(spending_means)), spending_means.values,
+           color=CATEGORY_COLORS[:len(spending_means)], edgecolor='white')
+    ax.set_xticks(range(len(spending_means)))
+    ax.set_xticklabels([col.replace('spend_', '').title() for col in spending_means.index],
+                       rotation=45, ha='right', color='white')
+    _set_labels(ax, None, 'Average Spending', 'Average Spending by Category')
+    ax.grid(True, alpha=0.3, axis='y')
+    return fig
+
+def plot_specs(df, clusters=None, large_data_threshold=LARGE_DATA_THRESHOLD, totals=None):
+    """
+    List the (plot_type, data, render) triples that apply to df.
+
+    totals may hold the 'cluster_counts' and 'spending_means' of the full
+    data when df is only a sample of it; those charts then use them.
+    """
+    totals = totals or {}
+    specs = []
+    large = len(df) > large_data_threshold
+
+    # 1. Age Distribution
+    if 'age' in df.columns:
+        specs.append(('age_distribution', df['age'], plot_age_distribution))
+
+    # 2. Income vs Total Spent
+    if 'annual_income' in df.columns and 'total_spent' in df.columns:
+        if large:
+            specs.append(('income_vs_spend', histogram_2d(df['annual_income'], df['total_spent']),
+                          plot_income_vs_spend_density))
+        else:
+            specs.append(('income_vs_spend', df[['annual_income', 'total_spent']], plot_income_vs_spend))
+
+    # 3. Cluster Distribution (if clusters exist)
+    if 'cluster_counts' in totals:
+        specs.append(('cluster_distribution', totals['cluster_counts'], plot_cluster_distribution))
+    elif clusters is not None:
+        cluster_counts = pd.Series(np.asarray(clusters), name='cluster').value_counts().sort_index()
+        specs.append(('cluster_distribution', cluster_counts, plot_cluster_distribution))
+
+    # 4. Spending by Category
+    spend_cols = [col for col in SPEND_COLS if col in df.columns]
+    if 'spending_means' in totals:
+        specs.append(('spending_by_category', totals['spending_means'], plot_spending_by_category))
+    elif spend_cols:
+        specs.append(('spending_by_category', df[spend_cols].mean(), plot_spending_by_category))
+
+    return specs
+
+def generate_visualizations(df, clusters=None, image_dir=DEFAULT_IMAGE_DIR, max_files=PLOT_CACHE_MAX_FILES,
+                            render_pool=None, large_data_threshold=LARGE_DATA_THRESHOLD, totals=None):
+    """
+    Generate visualizations and return their paths relative to image_dir.
+
+    Cache misses are rendered concurrently on render_pool when one is given,
+    otherwise one after another in this thread. Datasets with more than
+    large_data_threshold rows are plotted from binned aggregates; totals
+    are passed on to plot_specs.
+    """
+    cache = PlotCache(os.path.join(image_dir, PLOT_SUBDIR), max_files=max_files)
+    plots = []
+    futures = []
+    rendered = False
+    start = time.perf_counter()
+    for plot_type, data, render in plot_specs(df, clusters, large_data_threshold, totals):
+        filename, path, hit = cache.lookup(plot_type, data)
+        plots.append(f'{PLOT_SUBDIR}/{filename}')
+        if hit:
+            metrics.record('visualize', 'cache_hit', 0.0)
+            continue
+        rendered = True
+        if render_pool is not None:
+            futures.append((plot_type, render_pool.submit(render_to_file, render, data, path, **SAVEFIG_KWARGS)))
+        else:
+            with metrics.stage('visualize', plot_type, rows=len(df)):
+                render_to_file(render, data, path, **SAVEFIG_KWARGS)
+
+    for plot_type, future in futures:
+        future.result()
+        # Charts render concurrently, so this is the time until each one was ready
+        metrics.record('visualize', plot_type, time.perf_counter() - start, rows=len(df))
+    if rendered:
+        cache.evict()
+    return plots